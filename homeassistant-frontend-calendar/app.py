@@ -1,16 +1,28 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, ValidationError
+from typing import Iterator, Literal, Optional
+import asyncio
+import csv
+import hashlib
+import httpx
 import paramiko
 import json
+import re
 import uuid
-from datetime import datetime, date
-from icalendar import Calendar, Event, vText
+from datetime import datetime, date, time as dt_time, timedelta
+from dateutil.rrule import rruleset, rrulestr
+from icalendar import Calendar, Event, vRecur, vText
 import io
 import logging
-import requests
+import shlex
+import threading
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from itertools import accumulate
 from zoneinfo import ZoneInfo
 
 logging.basicConfig(level=logging.INFO)
@@ -18,7 +30,25 @@ logger = logging.getLogger(__name__)
 
 LOCAL_TZ = ZoneInfo("Europe/Berlin")
 
-app = FastAPI(title="Kalender API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global ha_http, write_queue
+    # Ein HTTP-Client für alle HA-Aufrufe, Verbindungen bleiben offen
+    ha_http = httpx.AsyncClient(timeout=5)
+    write_queue = WriteQueue()
+    write_queue.start()
+    try:
+        yield
+    finally:
+        await write_queue.stop()
+        await flush_ha_reload()
+        await ha_http.aclose()
+        ha_http = None
+        sftp_pool.close()
+
+
+app = FastAPI(title="Kalender API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,12 +56,38 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# JSON, HTML und ICS-Export komprimiert ausliefern (nur wenn der Client gzip kann)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 with open("config.json") as f:
     CONFIG = json.load(f)
 
 
-def ha_reload_calendar():
+ha_http: httpx.AsyncClient | None = None
+
+
+# local_calendar-Entry-ID, gilt `ha_entry_ttl` Sekunden bzw. bis HA mit 404 antwortet
+_ha_entry = {"id": None, "at": 0.0}
+
+
+async def ha_entry_id(ha_url: str, headers: dict, refresh: bool = False) -> str | None:
+    """Entry-ID der local_calendar-Integration (gecacht, nur bei Bedarf neu aus HA gelesen)."""
+    ttl = CONFIG.get("ha_entry_ttl", 3600)
+    if not refresh and _ha_entry["id"] and time.monotonic() - _ha_entry["at"] < ttl:
+        return _ha_entry["id"]
+    # Config-Entries laden und local_calendar finden
+    r = await ha_http.get(f"{ha_url}/api/config/config_entries/entry", headers=headers)
+    r.raise_for_status()
+    entry_id = None
+    for e in r.json():
+        if e.get("domain") == "local_calendar":
+            entry_id = e.get("entry_id")
+            break
+    _ha_entry.update(id=entry_id, at=time.monotonic())
+    return entry_id
+
+
+async def ha_reload_calendar():
     """Kalender-Integration in HA neu laden."""
     try:
         ha_url = CONFIG.get("ha_url", "").rstrip("/")
@@ -39,24 +95,71 @@ def ha_reload_calendar():
         if not ha_url or not ha_token:
             logger.warning("ha_url oder ha_token fehlt in config.json — HA-Reload übersprungen")
             return
+        if ha_http is None:
+            logger.warning("HTTP-Client nicht initialisiert — HA-Reload übersprungen")
+            return
         headers = {"Authorization": f"Bearer {ha_token}", "Content-Type": "application/json"}
-        # Config-Entries laden und local_calendar finden
-        r = requests.get(f"{ha_url}/api/config/config_entries/entry", headers=headers, timeout=5)
-        entries = r.json()
-        entry_id = None
-        for e in entries:
-            if e.get("domain") == "local_calendar":
-                entry_id = e.get("entry_id")
+        for refresh in (False, True):
+            entry_id = await ha_entry_id(ha_url, headers, refresh)
+            if not entry_id:
+                logger.warning("local_calendar Config-Entry nicht gefunden")
+                return
+            r = await ha_http.post(f"{ha_url}/api/config/config_entries/entry/{entry_id}/reload", headers=headers)
+            # 404: Integration wurde neu angelegt, Entry-ID einmal neu auflösen
+            if r.status_code != 404 or refresh:
                 break
-        if not entry_id:
-            logger.warning("local_calendar Config-Entry nicht gefunden")
-            return
-        requests.post(f"{ha_url}/api/config/config_entries/entry/{entry_id}/reload", headers=headers, timeout=5)
+        r.raise_for_status()
         logger.info("HA Calendar neu geladen ✓")
     except Exception as ex:
         logger.warning(f"HA-Reload fehlgeschlagen (nicht kritisch): {ex}")
 
 
+# Debounce: Schreibzugriffe innerhalb von `ha_reload_debounce` Sekunden
+# lösen zusammen genau einen HA-Reload aus.
+_ha_reload = {"task": None, "due": 0.0, "pending": False}
+
+
+def request_ha_reload():
+    """Merkt einen HA-Reload vor; jeder weitere Aufruf schiebt ihn ans Ende des Fensters."""
+    loop = asyncio.get_running_loop()
+    _ha_reload["due"] = loop.time() + CONFIG.get("ha_reload_debounce", 2)
+    _ha_reload["pending"] = True
+    task = _ha_reload["task"]
+    if task is None or task.done():
+        _ha_reload["task"] = loop.create_task(_debounced_ha_reload())
+
+
+async def _debounced_ha_reload():
+    loop = asyncio.get_running_loop()
+    while _ha_reload["pending"]:
+        delay = _ha_reload["due"] - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            continue
+        # Änderungen während des Reloads setzen pending wieder -> nächste Runde
+        _ha_reload["pending"] = False
+        try:
+            await ha_reload_calendar()
+        except asyncio.CancelledError:
+            _ha_reload["pending"] = True
+            raise
+
+
+async def flush_ha_reload():
+    """Beim Herunterfahren: vorgemerkten Reload sofort ausführen statt ihn zu verlieren."""
+    task = _ha_reload["task"]
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _ha_reload["task"] = None
+    if _ha_reload["pending"]:
+        _ha_reload["pending"] = False
+        await ha_reload_calendar()
+
+
 def get_ssh_client():
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -73,58 +176,758 @@ def get_ssh_client():
     return client
 
 
-def ssh_read_ics() -> bytes:
-    client = get_ssh_client()
-    try:
-        sftp = client.open_sftp()
+# Fehler, nach denen eine SFTP-Session unbrauchbar ist (Verbindung weg, Kanal zu)
+SSH_CONNECTION_ERRORS = (paramiko.SSHException, EOFError, ConnectionError, TimeoutError)
+
+
+class SFTPPool:
+    """
+    Begrenzter Pool langlebiger SSH/SFTP-Sessions zum HA-Host.
+
+    Statt pro Zugriff einen kompletten SSH-Handshake (Key-Exchange + Auth)
+    zu machen, werden Sessions wiederverwendet. Vor der Ausgabe wird geprüft,
+    ob der Transport noch lebt; länger ungenutzte Sessions werden zusätzlich
+    mit einem stat() angepingt. Reißt eine wiederverwendete Session mitten
+    im Zugriff ab, wird der Zugriff einmal auf einer frischen Verbindung wiederholt.
+    """
+
+    def __init__(self, size: int, keepalive: int = 30, probe_after: float = 30.0):
+        self.keepalive = keepalive
+        self.probe_after = probe_after
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []  # [(client, sftp, zuletzt benutzt)]
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        client = get_ssh_client()
+        client.get_transport().set_keepalive(self.keepalive)
+        logger.info("SFTP-Session zum HA-Host aufgebaut")
+        return client, client.open_sftp()
+
+    def _healthy(self, client, sftp, last_used: float) -> bool:
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if time.monotonic() - last_used > self.probe_after:
+            try:
+                sftp.stat(".")
+            except Exception:
+                return False
+        return True
+
+    def _checkout(self):
+        """Liefert (client, sftp, wiederverwendet)."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                client, sftp, last_used = self._idle.pop()
+            if self._healthy(client, sftp, last_used):
+                return client, sftp, True
+            logger.info("SFTP-Session tot, wird verworfen")
+            client.close()
+        return (*self._connect(), False)
+
+    def _checkin(self, client, sftp):
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            client.close()
+            return
+        with self._lock:
+            self._idle.append((client, sftp, time.monotonic()))
+
+    def run(self, fn):
+        """Führt fn(sftp) auf einer Pool-Session aus, bei abgerissener Session einmal erneut."""
+        with self._slots:
+            client, sftp, reused = self._checkout()
+            for attempt in (1, 2):
+                try:
+                    result = fn(sftp)
+                except SSH_CONNECTION_ERRORS as ex:
+                    client.close()
+                    if not reused or attempt == 2:
+                        raise
+                    logger.info(f"SFTP-Session abgerissen ({ex!r}), neuer Versuch")
+                    client, sftp = self._connect()
+                    reused = False
+                    continue
+                except BaseException:
+                    self._checkin(client, sftp)
+                    raise
+                self._checkin(client, sftp)
+                return result
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for client, _, _ in idle:
+            client.close()
+
+
+sftp_pool = SFTPPool(CONFIG.get("ssh_pool_size", 2))
+
+
+def _stat_key(attrs) -> tuple:
+    """Identität einer Dateiversion auf dem HA-Host (mtime + Größe)."""
+    return attrs.st_mtime, attrs.st_size
+
+
+def ssh_read_ics(known_key: tuple | None = None) -> tuple[tuple, bytes | None]:
+    """
+    Liest die ICS-Datei. Liefert (stat_key, Inhalt); Inhalt ist None, wenn
+    die Datei noch `known_key` entspricht (dann kostet der Aufruf nur ein stat).
+    """
+    def read(sftp):
+        key = _stat_key(sftp.stat(CONFIG["ics_path"]))
+        if key == known_key:
+            return key, None
         with sftp.open(CONFIG["ics_path"], "rb") as f:
-            return f.read()
-    finally:
-        client.close()
+            f.prefetch()
+            return key, f.read()
+    return sftp_pool.run(read)
 
 
-def ssh_write_ics(content: bytes):
-    client = get_ssh_client()
+class WriteConflict(Exception):
+    """Die ICS-Datei wurde zwischen Lesen und Schreiben von außen geändert (z.B. durch HA)."""
+
+
+def _ssh_exec(sftp, command: str) -> bool:
+    """Shell-Kommando auf dem HA-Host über die Verbindung der SFTP-Session."""
+    channel = sftp.get_channel().get_transport().open_session(timeout=10)
     try:
-        sftp = client.open_sftp()
-        # Backup anlegen
-        try:
-            sftp.rename(CONFIG["ics_path"], CONFIG["ics_path"] + ".bak")
-        except Exception:
-            pass
-        with sftp.open(CONFIG["ics_path"], "wb") as f:
-            f.write(content)
+        channel.exec_command(command)
+        return channel.recv_exit_status() == 0
     finally:
-        client.close()
+        channel.close()
 
 
-def ics_to_events(content: bytes) -> list:
-    cal = Calendar.from_ical(content)
+def ssh_write_ics(content: bytes, expected_key: tuple | None) -> tuple:
+    """
+    Schreibt die ICS-Datei atomar und liefert den stat_key der neuen Version.
+
+    Upload in `<ics_path>.tmp`, die bisherige Version wird als .bak hart
+    verlinkt, dann ersetzt ein Rename das Original -- Leser sehen immer eine
+    vollständige Datei. Passt die Datei nicht mehr zu `expected_key`, wird
+    nichts ersetzt (WriteConflict).
+    """
+    path = CONFIG["ics_path"]
+    tmp = path + ".tmp"
+
+    def write(sftp):
+        with sftp.open(tmp, "wb") as f:
+            # Pipelined: Blöcke gehen ohne Warten auf das jeweilige ACK raus
+            f.set_pipelined(True)
+            f.write(content)
+        try:
+            current = _stat_key(sftp.stat(path))
+        except FileNotFoundError:
+            current = None
+        if current != expected_key:
+            sftp.remove(tmp)
+            raise WriteConflict(f"{path} wurde zwischenzeitlich geändert")
+        # Backup: Hardlink statt Kopie, die alte Version bleibt unter .bak erhalten
+        if current is not None and not _ssh_exec(sftp, f"ln -f {shlex.quote(path)} {shlex.quote(path + '.bak')}"):
+            logger.warning("Backup (.bak) konnte nicht angelegt werden")
+        try:
+            sftp.posix_rename(tmp, path)
+        except IOError:
+            # Server ohne posix-rename-Erweiterung: mv ist ebenfalls ein atomares rename(2)
+            if not _ssh_exec(sftp, f"mv -f {shlex.quote(tmp)} {shlex.quote(path)}"):
+                raise
+        return _stat_key(sftp.stat(path))
+    return sftp_pool.run(write)
+
+
+def _event_to_dict(component) -> dict:
+    dtstart = component.get("DTSTART").dt
+    dtend = component.get("DTEND").dt
+    all_day = isinstance(dtstart, date) and not isinstance(dtstart, datetime)
+    # Timed events: in lokale Zeit konvertieren damit das Datum stimmt
+    if not all_day:
+        if hasattr(dtstart, 'tzinfo') and dtstart.tzinfo is not None:
+            dtstart = dtstart.astimezone(LOCAL_TZ)
+        if hasattr(dtend, 'tzinfo') and dtend.tzinfo is not None:
+            dtend = dtend.astimezone(LOCAL_TZ)
+    return {
+        "uid": str(component.get("UID", "")),
+        "summary": str(component.get("SUMMARY", "")),
+        "description": str(component.get("DESCRIPTION", "")),
+        "start": dtstart.isoformat(),
+        "end": dtend.isoformat(),
+        "all_day": all_day,
+    }
+
+
+def _as_list(prop) -> list:
+    """ICS-Properties, die mehrfach vorkommen dürfen, kommen mal einzeln, mal als Liste."""
+    if prop is None:
+        return []
+    return prop if isinstance(prop, list) else [prop]
+
+
+def _local_naive(value) -> datetime:
+    """date/datetime (naiv oder mit TZ) als naive lokale Zeit, Basis für die RRULE-Expansion."""
+    if not isinstance(value, datetime):
+        return datetime.combine(value, dt_time())
+    if value.tzinfo is not None:
+        return value.astimezone(LOCAL_TZ).replace(tzinfo=None)
+    return value
+
+
+class RecurringSeries:
+    """
+    Wiederkehrendes Event (RRULE/RDATE abzüglich EXDATE und RECURRENCE-ID-Ausnahmen).
+
+    Vorkommen werden nie vollständig erzeugt, sondern nur für ein Abfragefenster
+    (dateutil rruleset.between), gerechnet in lokaler Wandzeit -- eine wöchentliche
+    Frühschicht bleibt so auch über die Zeitumstellung um 06:00.
+    """
+
+    def __init__(self, component, overridden=()):
+        dtstart = component.get("DTSTART").dt
+        self.uid = str(component.get("UID", ""))
+        self.summary = str(component.get("SUMMARY", ""))
+        self.description = str(component.get("DESCRIPTION", ""))
+        self.all_day = isinstance(dtstart, date) and not isinstance(dtstart, datetime)
+        self.aware = isinstance(dtstart, datetime) and dtstart.tzinfo is not None
+
+        start = _local_naive(dtstart)
+        if component.get("DTEND") is not None:
+            end = _local_naive(component.get("DTEND").dt)
+        elif component.get("DURATION") is not None:
+            end = start + component.get("DURATION").dt
+        else:
+            end = start + (timedelta(days=1) if self.all_day else timedelta(0))
+        self.duration = end - start
+
+        # cache=True: bereits erzeugte Vorkommen bleiben erhalten, spätere Fenster
+        # zählen nicht jedes Mal ab DTSTART (z.B. tägliche Serie seit Jahren)
+        self.rules = rruleset(cache=True)
+        last = [start]
+        finite = True
+        for rule in _as_list(component.get("RRULE")):
+            rule = vRecur(rule)
+            if rule.get("UNTIL"):
+                rule["UNTIL"] = [_local_naive(u) for u in rule["UNTIL"]]
+                last += rule["UNTIL"]
+            else:
+                # COUNT oder unendlich: Ende unbekannt, wird nie ausgerechnet
+                finite = False
+            self.rules.rrule(rrulestr(rule.to_ical().decode(), dtstart=start))
+        for prop in _as_list(component.get("RDATE")):
+            for value in prop.dts:
+                self.rules.rdate(_local_naive(value.dt))
+                last.append(_local_naive(value.dt))
+        for prop in _as_list(component.get("EXDATE")):
+            for value in prop.dts:
+                self.rules.exdate(_local_naive(value.dt))
+        for recurrence_id in overridden:
+            self.rules.exdate(recurrence_id)
+
+        self.first = start.date()
+        self.last_end = (max(last) + self.duration).date() if finite else None
+
+    def _occurrence(self, start: datetime) -> dict:
+        end = start + self.duration
+        if self.all_day:
+            start, end = start.date(), end.date()
+        elif self.aware:
+            start, end = start.replace(tzinfo=LOCAL_TZ), end.replace(tzinfo=LOCAL_TZ)
+        return {
+            "uid": self.uid,
+            "summary": self.summary,
+            "description": self.description,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "all_day": self.all_day,
+            "recurring": True,
+        }
+
+    def occurrences(self, start: date, end: date) -> list:
+        """Vorkommen, die vor `end` beginnen und nicht vor `start` enden."""
+        if self.first >= end or (self.last_end is not None and self.last_end < start):
+            return []
+        lower = datetime.combine(start, dt_time()) - self.duration - timedelta(days=1)
+        upper = datetime.combine(end, dt_time())
+        return [
+            self._occurrence(occ)
+            for occ in self.rules.between(lower, upper, inc=True)
+            if occ.date() < end and (occ + self.duration).date() >= start
+        ]
+
+
+def components_to_events(components: list) -> tuple[list, dict]:
+    """
+    Wandelt VEVENT-Komponenten um. Liefert (Einzel-Events inkl. geänderter
+    Serientermine, Serien nach UID); Serien werden erst bei der Abfrage expandiert.
+    """
+    # Per RECURRENCE-ID ersetzte Vorkommen fallen aus der Serie heraus
+    overridden = {}
+    for component in components:
+        if component.get("RECURRENCE-ID") is not None:
+            uid = str(component.get("UID", ""))
+            overridden.setdefault(uid, set()).add(_local_naive(component.get("RECURRENCE-ID").dt))
+
     events = []
-    for component in cal.walk():
-        if component.name != "VEVENT":
-            continue
+    series = {}
+    for component in components:
         try:
-            dtstart = component.get("DTSTART").dt
-            dtend = component.get("DTEND").dt
-            all_day = isinstance(dtstart, date) and not isinstance(dtstart, datetime)
-            # Timed events: in lokale Zeit konvertieren damit das Datum stimmt
-            if not all_day:
-                if hasattr(dtstart, 'tzinfo') and dtstart.tzinfo is not None:
-                    dtstart = dtstart.astimezone(LOCAL_TZ)
-                if hasattr(dtend, 'tzinfo') and dtend.tzinfo is not None:
-                    dtend = dtend.astimezone(LOCAL_TZ)
-            events.append({
-                "uid": str(component.get("UID", "")),
-                "summary": str(component.get("SUMMARY", "")),
-                "description": str(component.get("DESCRIPTION", "")),
-                "start": dtstart.isoformat(),
-                "end": dtend.isoformat(),
-                "all_day": all_day,
-            })
+            is_override = component.get("RECURRENCE-ID") is not None
+            if not is_override and (component.get("RRULE") is not None or component.get("RDATE") is not None):
+                s = RecurringSeries(component, overridden.get(str(component.get("UID", "")), ()))
+                series[s.uid] = s
+                continue
+            if is_override and str(component.get("STATUS", "")).upper() == "CANCELLED":
+                continue
+            event = _event_to_dict(component)
+            if is_override:
+                event["recurring"] = True
+            events.append(event)
         except Exception as e:
             logger.warning(f"Event übersprungen: {e}")
-    return events
+    return events, series
+
+
+def ics_to_events(content: bytes) -> tuple[list, dict]:
+    cal = Calendar.from_ical(content)
+    return components_to_events([c for c in cal.walk() if c.name == "VEVENT"])
+
+
+# VEVENT-Blöcke in der rohen Datei (VEVENTs sind nie verschachtelt)
+VEVENT_RE = re.compile(rb"^BEGIN:VEVENT\r?\n.*?^END:VEVENT(?:\r?\n|\Z)", re.M | re.S)
+UID_RE = re.compile(rb"^UID(?:;[^:\r\n]*)?:(.*(?:\r?\n[ \t].*)*)", re.M)
+VTIMEZONE_RE = re.compile(rb"^BEGIN:VTIMEZONE\r?\n.*?^END:VTIMEZONE(?:\r?\n|\Z)", re.M | re.S)
+TZID_RE = re.compile(rb"^TZID(?:;[^:\r\n]*)?:(.*(?:\r?\n[ \t].*)*)", re.M)
+FOLD_RE = re.compile(rb"\r?\n[ \t]")
+
+
+class IcsBlocks:
+    """
+    Byte-Offsets aller VEVENT-Blöcke der rohen ICS-Datei, nach UID, und aller
+    VTIMEZONE-Blöcke, nach TZID.
+
+    Schreibzugriffe tauschen damit nur die Bytes eines Events aus (einfügen,
+    ersetzen, entfernen). Der Rest der Datei wird weder geparst noch neu
+    serialisiert -- auch Properties, die icalendar nicht kennt, bleiben erhalten.
+    """
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.newline = b"\r\n" if b"\r\n" in content[:4096] or not content else b"\n"
+        self.blocks = {}
+        for m in VEVENT_RE.finditer(content):
+            uid = UID_RE.search(m.group(0))
+            if uid:
+                uid = FOLD_RE.sub(b"", uid.group(1)).strip().decode("utf-8", "replace")
+                self.blocks.setdefault(uid, []).append((m.start(), m.end()))
+        self.timezones = {}
+        for m in VTIMEZONE_RE.finditer(content):
+            tzid = TZID_RE.search(m.group(0))
+            if tzid:
+                tzid = FOLD_RE.sub(b"", tzid.group(1)).strip().decode("utf-8", "replace")
+                self.timezones.setdefault(tzid, (m.start(), m.end()))
+
+    def components(self, uid: str) -> list:
+        """Alle VEVENTs mit dieser UID (Serie + Ausnahmen), nur diese Blöcke werden geparst."""
+        return [Event.from_ical(self.content[a:b]) for a, b in self.blocks.get(uid, [])]
+
+    def encode(self, component) -> bytes:
+        data = component.to_ical()
+        return data if self.newline == b"\r\n" else data.replace(b"\r\n", b"\n")
+
+    def splice(self, changes: dict, timezones=()) -> "IcsBlocks":
+        """
+        Neue Dateiversion, in der für jede UID in `changes` ({uid: [VEVENTs]})
+        die Blöcke ersetzt sind (leer = löschen, unbekannte UID = vor
+        END:VCALENDAR einfügen). VTIMEZONEs aus `timezones`, deren TZID die
+        Datei noch nicht kennt, kommen ebenfalls vor END:VCALENDAR. Die Offsets
+        der übrigen Blöcke werden nur verschoben, nicht neu gesucht.
+        """
+        edits = []      # (von, bis, uid, neue Bytes), nach Position sortiert
+        new_timezones = {}
+        for component in timezones:
+            tzid = str(component.get("TZID", ""))
+            if tzid and tzid not in self.timezones and tzid not in new_timezones:
+                new_timezones[tzid] = self.encode(component)
+        inserts = [(None, data) for data in new_timezones.values()]
+        for uid, components in changes.items():
+            data = b"".join(self.encode(c) for c in components)
+            spans = self.blocks.get(uid)
+            if spans:
+                # Ersatz an die Stelle des ersten Blocks, weitere Blöcke der UID entfallen
+                edits.append((spans[0][0], spans[0][1], uid, data))
+                edits += [(a, b, None, b"") for a, b in spans[1:]]
+            elif data:
+                inserts.append((uid, data))
+        if inserts:
+            pos = self.content.rfind(b"END:VCALENDAR")
+            if pos < 0:
+                raise ValueError("END:VCALENDAR fehlt in der ICS-Datei")
+            edits += [(pos, pos, uid, data) for uid, data in inserts]
+        edits.sort(key=lambda e: e[0])
+
+        parts = []
+        new_spans = {}
+        added_timezones = {}
+        pos = out = 0
+        for a, b, uid, data in edits:
+            parts += [self.content[pos:a], data]
+            out += a - pos
+            if uid is not None and data:
+                new_spans[uid] = [(out + m.start(), out + m.end()) for m in VEVENT_RE.finditer(data)]
+            elif a == b and data:
+                tzid = FOLD_RE.sub(b"", TZID_RE.search(data).group(1)).strip().decode("utf-8", "replace")
+                added_timezones[tzid] = (out, out + len(data))
+            out += len(data)
+            pos = b
+        parts.append(self.content[pos:])
+
+        # Verschiebung aller Offsets hinter einer Änderung; `a < x`: ein Block,
+        # der genau an der Einfügestelle endet, bleibt stehen
+        starts = [e[0] for e in edits]
+        shifts = [0, *accumulate(len(data) - (b - a) for a, b, _, data in edits)]
+
+        def shift(x: int) -> int:
+            return x + shifts[bisect_left(starts, x)]
+
+        new = IcsBlocks.__new__(IcsBlocks)
+        new.content = b"".join(parts)
+        new.newline = self.newline
+        new.blocks = {
+            uid: [(shift(a), shift(b)) for a, b in spans]
+            for uid, spans in self.blocks.items()
+            if uid not in changes
+        }
+        new.blocks.update(new_spans)
+        new.timezones = {tzid: (shift(a), shift(b)) for tzid, (a, b) in self.timezones.items()}
+        new.timezones.update(added_timezones)
+        return new
+
+    def iter_blocks(self, uids) -> Iterator[bytes]:
+        """
+        Kopf der Datei, alle VTIMEZONEs, die Blöcke der UIDs und END:VCALENDAR --
+        roh, ohne Parsen. Importierte VTIMEZONEs stehen hinter den Events und
+        gehören deshalb nicht zum Kopf.
+        """
+        first = min((spans[0][0] for spans in self.blocks.values()), default=None)
+        end = self.content.rfind(b"END:VCALENDAR")
+        if end < 0:
+            raise ValueError("END:VCALENDAR fehlt in der ICS-Datei")
+        head = end if first is None else first
+        yield self.content[:head]
+        for a, b in sorted(self.timezones.values()):
+            if a >= head:
+                yield self.content[a:b]
+        for uid in uids:
+            for a, b in self.blocks.get(uid, []):
+                yield self.content[a:b]
+        yield self.content[end:]
+
+
+class EventIndex:
+    """
+    Events sortiert nach Startdatum, plus laufendes Maximum der Enddaten.
+
+    Eine Bereichsabfrage [von, bis) sucht per Bisektion das erste Event, das
+    nicht vor `bis` beginnt, und das erste, dessen Präfix-Maximum der Enddaten
+    `von` erreicht -- dazwischen liegen alle Kandidaten. Kosten: O(log n) plus
+    die Länge dieses Fensters statt eines Scans über alle Events.
+
+    Serien werden pro (UID, Fenster) expandiert und gemerkt; der Index wird bei
+    jeder Dateiänderung neu gebaut, damit verfällt auch dieser Memo.
+    Schreibzugriffe über die API leiten mit replace() einen neuen Index ab,
+    ohne die Daten aller übrigen Events erneut zu parsen.
+    """
+
+    MEMO_SIZE = 4096
+
+    def __init__(self, events: list, series: dict | None = None):
+        self._build(self._keyed(events), dict(series or {}), {})
+
+    @staticmethod
+    def _keyed(events: list) -> list:
+        keyed = []
+        for e in events:
+            try:
+                keyed.append((date.fromisoformat(e["start"][:10]), date.fromisoformat(e["end"][:10]), e))
+            except Exception:
+                pass
+        return keyed
+
+    def _build(self, keyed: list, series: dict, memo: dict):
+        keyed.sort(key=lambda k: k[0])
+        self.series = series
+        self._memo = memo
+        self.starts = [k[0] for k in keyed]
+        self.ends = [k[1] for k in keyed]
+        self.events = [k[2] for k in keyed]
+        self.max_end = list(accumulate(self.ends, max))
+
+    def replace(self, uids: set, events: list, series: dict) -> "EventIndex":
+        """Neuer Index, in dem alle Einträge der `uids` durch `events`/`series` ersetzt sind."""
+        keyed = [k for k in zip(self.starts, self.ends, self.events) if k[2]["uid"] not in uids]
+        keyed += self._keyed(events)
+        new_series = {k: v for k, v in self.series.items() if k not in uids}
+        new_series.update(series)
+        # replace() läuft im Writer-Thread, overlapping() füllt/leert den Memo parallel
+        # im Event-Loop: erst kopieren (dict.copy() ist unter dem GIL atomar), dann filtern
+        memo = {k: v for k, v in self._memo.copy().items() if k[0] not in uids}
+        index = EventIndex.__new__(EventIndex)
+        index._build(keyed, new_series, memo)
+        return index
+
+    def overlapping(self, start: date, end: date) -> list:
+        """Events, die vor `end` beginnen und nicht vor `start` enden (Semantik wie bisher je Monat)."""
+        hi = bisect_left(self.starts, end)
+        lo = bisect_left(self.max_end, start, 0, hi)
+        result = [self.events[i] for i in range(lo, hi) if self.ends[i] >= start]
+
+        expanded = False
+        for s in self.series.values():
+            key = (s.uid, start, end)
+            occurrences = self._memo.get(key)
+            if occurrences is None:
+                if len(self._memo) >= self.MEMO_SIZE:
+                    self._memo.clear()
+                occurrences = self._memo[key] = s.occurrences(start, end)
+            if occurrences:
+                result += occurrences
+                expanded = True
+        if expanded:
+            result.sort(key=lambda e: e["start"])
+        return result
+
+
+def _etag(content: bytes) -> str:
+    """
+    ETag einer Dateiversion (SHA-256 des Inhalts). Schwach (W/), weil die
+    GZipMiddleware denselben Stand je nach Accept-Encoding gzip- oder
+    unkomprimiert ausliefert; ein starker ETag darf nur eine Kodierung
+    bezeichnen (RFC 9110, 8.8.3).
+    """
+    return 'W/"' + hashlib.sha256(content).hexdigest() + '"'
+
+
+def _opaque_tag(tag: str) -> str:
+    return tag.strip().removeprefix("W/")
+
+
+# Geparster Kalender, gültig solange mtime/size der Datei auf dem HA-Host passen.
+# Schreibzugriffe über diese API aktualisieren den Cache direkt.
+_cache_lock = threading.Lock()
+_cache = {"key": None, "etag": _etag(b""), "content": b"", "events": [], "series": {},
+          "index": EventIndex([]), "blocks": None, "checked": 0.0}
+
+
+def load_state(blocks: bool = False, fresh: bool = False) -> dict:
+    """
+    Konsistenter Schnappschuss des Caches (key, etag, content, events, series,
+    index, blocks); lädt und parst nur neu, wenn sich die Datei geändert hat.
+    Mit `blocks=True` ist auch der Byte-Offset-Index gebaut (einmal pro Version).
+
+    Die Datei wird höchstens alle `ics_stat_interval` Sekunden per stat geprüft
+    (`fresh=True`: immer). Änderungen über diese API landen ohnehin sofort im
+    Cache, nur Änderungen aus HA selbst erscheinen bis zu so viel später.
+    """
+    with _cache_lock:
+        known_key = _cache["key"]
+        recent = time.monotonic() - _cache["checked"] < CONFIG.get("ics_stat_interval", 2)
+        state = dict(_cache) if known_key is not None and recent and not fresh else None
+    if state is None:
+        key, content = ssh_read_ics(known_key)
+        checked = time.monotonic()
+        with _cache_lock:
+            state = dict(_cache)
+            if content is None and state["key"] == key:
+                _cache["checked"] = checked
+        if content is None and state["key"] != key:
+            # Cache wurde zwischenzeitlich ersetzt: vollständig neu lesen
+            key, content = ssh_read_ics()
+        if content is not None:
+            events, series = ics_to_events(content)
+            state = dict(key=key, etag=_etag(content), content=content, events=events, series=series,
+                         index=EventIndex(events, series), blocks=None, checked=checked)
+            with _cache_lock:
+                _cache.update(state)
+    if blocks and state["blocks"] is None:
+        state["blocks"] = IcsBlocks(state["content"])
+        with _cache_lock:
+            if _cache["content"] is state["content"]:
+                _cache["blocks"] = state["blocks"]
+    return state
+
+
+def write_events(state: dict, changes: dict, timezones=()) -> str:
+    """
+    Ersetzt ausgehend von `state` (load_state(blocks=True)) für jede UID in
+    `changes` ({uid: [VEVENTs]}) alle VEVENTs (leer = löschen, unbekannte UID =
+    anlegen), ergänzt fehlende VTIMEZONEs aus `timezones`, schreibt die Datei
+    in einem Upload und aktualisiert Cache und Index nur für diese UIDs.
+    Liefert den ETag der neuen Version.
+    """
+    new_blocks = state["blocks"].splice(changes, timezones)
+    key = ssh_write_ics(new_blocks.content, state["key"])
+    etag = _etag(new_blocks.content)
+    new_events, new_series = components_to_events([c for components in changes.values() for c in components])
+    uids = set(changes)
+    events = [e for e in state["events"] if e["uid"] not in uids] + new_events
+    series = {k: v for k, v in state["series"].items() if k not in uids}
+    series.update(new_series)
+    with _cache_lock:
+        _cache.update(key=key, etag=etag, content=new_blocks.content, events=events, series=series,
+                      index=state["index"].replace(uids, new_events, new_series), blocks=new_blocks,
+                      checked=time.monotonic())
+    return etag
+
+
+def etag_matches(if_match: str, etag: str | None) -> bool:
+    """
+    If-Match-Vergleich über den Dateistand; `etag` None = Stand nicht mehr der
+    gelesene. Der ETag ist nur wegen der Content-Codings schwach, er bezeichnet
+    genau eine Dateiversion; daher zählt der Hash, mit oder ohne W/.
+    `*` passt auf jeden Stand, solange der Kalender existiert (RFC 9110 13.1.1).
+    """
+    tags = [tag.strip() for tag in if_match.split(",")]
+    if "*" in tags:
+        return True
+    if etag is None:
+        return False
+    return any(_opaque_tag(tag) == _opaque_tag(etag) for tag in tags)
+
+
+class WriteTx:
+    """Sicht einer Mutation: Dateistand plus die Änderungen der vor ihr eingereihten Mutationen."""
+
+    def __init__(self, blocks: IcsBlocks, pending: dict):
+        self.blocks = blocks
+        self.pending = pending
+        self.changes = {}
+        self.timezones = []
+
+    def components(self, uid: str) -> list:
+        if uid in self.changes:
+            return self.changes[uid]
+        if uid in self.pending:
+            # Kopien: eine fehlschlagende Mutation darf den Stand der vorherigen nicht verändern
+            return [Event.from_ical(c.to_ical()) for c in self.pending[uid]]
+        return self.blocks.components(uid)
+
+    def put(self, uid: str, components: list):
+        self.changes[uid] = components
+
+    def add_timezone(self, component):
+        """VTIMEZONE mitschreiben, falls die Datei ihre TZID noch nicht kennt."""
+        self.timezones.append(component)
+
+
+class WriteQueue:
+    """
+    Serialisiert alle Schreibzugriffe in einem Writer-Task.
+
+    Mutationen sind Funktionen mutate(tx) -> Ergebnis. Was sich während eines
+    Uploads ansammelt, wird nacheinander auf denselben Stand angewendet und
+    gemeinsam hochgeladen (ein Upload, ein HA-Reload); schlägt eine Mutation
+    fehl, betrifft das nur ihren Aufrufer. Lesezugriffe laufen unabhängig
+    davon aus dem Cache weiter. Bei einem WriteConflict wird neu gelesen und
+    die ganze Runde wiederholt.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Arbeitet die Warteschlange noch ab und beendet den Writer-Task."""
+        await self._queue.put(None)
+        await self._task
+
+    async def submit(self, mutate, if_match: str | None = None) -> tuple:
+        """Reiht eine Mutation ein; liefert (Ergebnis, ETag der geschriebenen Version)."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((mutate, if_match, future))
+        return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                return
+            items = [item]
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                items.append(item)
+            try:
+                outcomes, written = await asyncio.to_thread(self._apply, items)
+            except Exception as ex:
+                outcomes, written = [ex] * len(items), False
+            if written:
+                request_ha_reload()
+            for (_, _, future), outcome in zip(items, outcomes):
+                if future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+    def _apply(self, items: list) -> tuple[list, bool]:
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            state = load_state(blocks=True, fresh=True)
+            pending = {}
+            timezones = []
+            results = []
+            for mutate, if_match, _ in items:
+                # Nach einer vorherigen Änderung derselben Runde ist der gelesene Stand überholt
+                if if_match is not None and not etag_matches(if_match, None if pending else state["etag"]):
+                    results.append(HTTPException(status_code=412, detail="Kalender wurde zwischenzeitlich geändert"))
+                    continue
+                tx = WriteTx(state["blocks"], pending)
+                try:
+                    results.append(mutate(tx))
+                except Exception as ex:
+                    results.append(ex)
+                    continue
+                pending.update(tx.changes)
+                timezones += tx.timezones
+            if not pending:
+                return [r if isinstance(r, Exception) else (r, state["etag"]) for r in results], False
+            try:
+                etag = write_events(state, pending, timezones)
+            except WriteConflict as ex:
+                if attempt == self.MAX_ATTEMPTS:
+                    raise
+                logger.info(f"{ex} -- neu lesen und wiederholen")
+                continue
+            if len(items) > 1:
+                logger.info(f"{len(items)} Änderungen in einem Upload zusammengefasst")
+            return [r if isinstance(r, Exception) else (r, etag) for r in results], True
+
+
+write_queue: WriteQueue | None = None
+
+
+async def submit_write(mutate, if_match: str | None, response: Response, error: str):
+    """Mutation über die Write-Queue ausführen, ETag der neuen Version setzen."""
+    try:
+        result, etag = await write_queue.submit(mutate, if_match)
+    except HTTPException:
+        raise
+    except WriteConflict as ex:
+        raise HTTPException(status_code=409, detail=str(ex))
+    except Exception as ex:
+        logger.error(f"{error}: {ex}")
+        raise HTTPException(status_code=500, detail=str(ex))
+    response.headers["ETag"] = etag
+    return result
 
 
 class EventIn(BaseModel):
@@ -137,143 +940,332 @@ class EventIn(BaseModel):
     end_time: Optional[str] = "01:00"
 
 
-@app.get("/", response_class=HTMLResponse)
-def index():
+def read_template() -> str:
     with open("templates/index.html", encoding="utf-8") as f:
         return f.read()
 
 
+# Die Oberfläche wird einmal beim Start geladen (Änderungen: Service neu starten)
+INDEX_HTML = read_template().encode("utf-8")
+INDEX_ETAG = _etag(INDEX_HTML)
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match-Vergleich (schwach, wie von RFC 9110 für GET vorgesehen)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [_opaque_tag(tag) for tag in header.split(",")]
+    return "*" in tags or _opaque_tag(etag) in tags
+
+
+def cacheable(request: Request, etag: str, body, media_type: str) -> Response:
+    """
+    Antwort mit ETag; 304 ohne Body, wenn der Client den Stand schon hat.
+    `body` ist ein Callable und wird nur bei Bedarf erzeugt. `no-cache`: der
+    Browser fragt jedes Mal nach, bekommt aber meist nur ein 304.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body(), media_type=media_type, headers=headers)
+
+
+# Fertig serialisierte /api/events-Antworten der aktuellen Dateiversion, nach Bereich
+_rendered = {"etag": None, "bodies": {}}
+RENDERED_SIZE = 256
+
+
+def render_events(state: dict, start: date, end: date) -> bytes:
+    if _rendered["etag"] != state["etag"]:
+        _rendered.update(etag=state["etag"], bodies={})
+    bodies = _rendered["bodies"]
+    body = bodies.get((start, end))
+    if body is None:
+        if len(bodies) >= RENDERED_SIZE:
+            bodies.clear()
+        events = state["index"].overlapping(start, end)
+        body = bodies[(start, end)] = json.dumps(events, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body
+
+
+# Alle Routen sind async: SFTP-Zugriffe und Parsen laufen per asyncio.to_thread
+# im Threadpool, HA-Aufrufe über den gemeinsamen httpx-Client im Event-Loop.
+
+@app.get("/", response_class=HTMLResponse)
+async def index(request: Request):
+    return cacheable(request, INDEX_ETAG, lambda: INDEX_HTML, "text/html; charset=utf-8")
+
+
+def check_range(date_from: Optional[date], date_to: Optional[date]) -> tuple[date, date]:
+    if date_from is None or date_to is None:
+        raise HTTPException(status_code=400, detail="from und to müssen zusammen angegeben werden")
+    if date_to <= date_from:
+        raise HTTPException(status_code=400, detail="to muss nach from liegen")
+    return date_from, date_to
+
+
 @app.get("/api/events")
-def get_events(year: int, month: int, wide: int = 0):
-    try:
-        content = ssh_read_ics()
-        all_events = ics_to_events(content)
-        result = []
+async def get_events(
+    request: Request,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    wide: int = 0,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+):
+    """Events eines Monats (year/month) oder eines beliebigen Bereichs [from, to) (YYYY-MM-DD)."""
+    if date_from is not None or date_to is not None:
+        range_start, range_end = check_range(date_from, date_to)
+    elif year is not None and month is not None:
         # Monatsbereich berechnen
-        month_start = date(year, month, 1)
+        if not 1 <= month <= 12:
+            raise HTTPException(status_code=400, detail="month muss zwischen 1 und 12 liegen")
+        range_start = date(year, month, 1)
         if month == 12:
-            month_end = date(year + 1, 1, 1)
+            range_end = date(year + 1, 1, 1)
         else:
-            month_end = date(year, month + 1, 1)
+            range_end = date(year, month + 1, 1)
+    else:
+        raise HTTPException(status_code=400, detail="year/month oder from/to angeben")
 
-        for e in all_events:
-            try:
-                ev_start = date.fromisoformat(e["start"][:10])
-                ev_end = date.fromisoformat(e["end"][:10])
-                # Event überschneidet sich mit dem Monat?
-                if ev_start < month_end and ev_end >= month_start:
-                    result.append(e)
-            except Exception:
-                pass
-        return result
+    try:
+        state = await asyncio.to_thread(load_state)
+        # ETag = Dateiversion: gleiche Datei + gleicher Bereich -> gleiche Antwort
+        return cacheable(request, state["etag"], lambda: render_events(state, range_start, range_end),
+                         "application/json")
     except Exception as ex:
         logger.error(f"Fehler beim Lesen: {ex}")
         raise HTTPException(status_code=500, detail=str(ex))
 
 
-@app.post("/api/events")
-def create_event(ev: EventIn):
-    try:
-        content = ssh_read_ics()
-        cal = Calendar.from_ical(content)
-
-        new_ev = Event()
-        new_ev.add("SUMMARY", ev.summary)
-        new_ev.add("DESCRIPTION", ev.description or "")
-        new_ev.add("UID", str(uuid.uuid4()))
-        new_ev.add("DTSTAMP", datetime.utcnow())
-        new_ev.add("CREATED", datetime.utcnow())
-        new_ev.add("SEQUENCE", 0)
-
-        if ev.all_day:
-            new_ev.add("DTSTART", date.fromisoformat(ev.start_date))
-            new_ev.add("DTEND", date.fromisoformat(ev.end_date))
-        else:
-            new_ev.add("DTSTART", datetime.fromisoformat(f"{ev.start_date}T{ev.start_time}:00"))
-            new_ev.add("DTEND", datetime.fromisoformat(f"{ev.end_date}T{ev.end_time}:00"))
+def apply_event_input(component, ev: EventIn):
+    """Überträgt die Formularfelder auf ein VEVENT."""
+    component["SUMMARY"] = vText(ev.summary)
+    component["DESCRIPTION"] = vText(ev.description or "")
+    for key in ["DTSTART", "DTEND"]:
+        if key in component:
+            del component[key]
+    if ev.all_day:
+        component.add("DTSTART", date.fromisoformat(ev.start_date))
+        component.add("DTEND", date.fromisoformat(ev.end_date))
+    else:
+        component.add("DTSTART", datetime.fromisoformat(f"{ev.start_date}T{ev.start_time}:00"))
+        component.add("DTEND", datetime.fromisoformat(f"{ev.end_date}T{ev.end_time}:00"))
 
-        cal.add_component(new_ev)
-        ssh_write_ics(cal.to_ical())
-        ha_reload_calendar()
-        return {"status": "ok"}
-    except Exception as ex:
-        logger.error(f"Fehler beim Erstellen: {ex}")
-        raise HTTPException(status_code=500, detail=str(ex))
+
+def new_event(ev: EventIn) -> Event:
+    new_ev = Event()
+    new_ev.add("UID", str(uuid.uuid4()))
+    new_ev.add("DTSTAMP", datetime.utcnow())
+    new_ev.add("CREATED", datetime.utcnow())
+    new_ev.add("SEQUENCE", 0)
+    apply_event_input(new_ev, ev)
+    return new_ev
+
+
+def reject_series(components: list, what: str = "Ereignis"):
+    """
+    Serien (RRULE/RDATE) und ihre geänderten Termine (RECURRENCE-ID) tragen
+    alle dieselbe UID; Bearbeiten oder Löschen würde die ganze Serie treffen.
+    Einzeltermine bräuchten ein RECURRENCE-ID-Override bzw. EXDATE, das gibt es
+    hier (noch) nicht, daher 409.
+    """
+    for component in components:
+        if any(component.get(prop) is not None for prop in ("RRULE", "RDATE", "RECURRENCE-ID")):
+            raise HTTPException(status_code=409, detail=f"{what} ist ein Serientermin und kann hier nicht geändert werden")
+
+
+# Schreibende Routen laufen über die Write-Queue. Optionaler If-Match-Header
+# mit dem ETag aus einer vorherigen Antwort: 412, wenn der Kalender inzwischen
+# geändert wurde.
+
+@app.post("/api/events")
+async def create_event(ev: EventIn, response: Response, if_match: Optional[str] = Header(None)):
+    def mutate(tx: WriteTx):
+        new_ev = new_event(ev)
+        tx.put(str(new_ev["UID"]), [new_ev])
+        return {"status": "ok", "uid": str(new_ev["UID"])}
+    return await submit_write(mutate, if_match, response, "Fehler beim Erstellen")
 
 
 @app.put("/api/events/{uid}")
-def update_event(uid: str, ev: EventIn):
-    try:
-        content = ssh_read_ics()
-        cal = Calendar.from_ical(content)
-
-        new_cal = Calendar()
-        for attr in ["VERSION", "PRODID", "CALSCALE", "METHOD"]:
-            if cal.get(attr):
-                new_cal.add(attr, cal[attr])
-
-        found = False
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                if str(component.get("UID")) == uid:
-                    found = True
-                    component["SUMMARY"] = vText(ev.summary)
-                    component["DESCRIPTION"] = vText(ev.description or "")
-                    for key in ["DTSTART", "DTEND"]:
-                        if key in component:
-                            del component[key]
-                    if ev.all_day:
-                        component.add("DTSTART", date.fromisoformat(ev.start_date))
-                        component.add("DTEND", date.fromisoformat(ev.end_date))
-                    else:
-                        component.add("DTSTART", datetime.fromisoformat(f"{ev.start_date}T{ev.start_time}:00"))
-                        component.add("DTEND", datetime.fromisoformat(f"{ev.end_date}T{ev.end_time}:00"))
-                new_cal.add_component(component)
-            elif component.name != "VCALENDAR":
-                new_cal.add_component(component)
-
-        if not found:
+async def update_event(uid: str, ev: EventIn, response: Response, if_match: Optional[str] = Header(None)):
+    def mutate(tx: WriteTx):
+        components = tx.components(uid)
+        if not components:
             raise HTTPException(status_code=404, detail="Ereignis nicht gefunden")
+        reject_series(components)
+        for component in components:
+            apply_event_input(component, ev)
+        tx.put(uid, components)
+        return {"status": "ok"}
+    return await submit_write(mutate, if_match, response, "Fehler beim Bearbeiten")
 
-        ssh_write_ics(new_cal.to_ical())
-        ha_reload_calendar()
+
+@app.delete("/api/events/{uid}")
+async def delete_event(uid: str, response: Response, if_match: Optional[str] = Header(None)):
+    def mutate(tx: WriteTx):
+        components = tx.components(uid)
+        if not components:
+            raise HTTPException(status_code=404, detail="Ereignis nicht gefunden")
+        reject_series(components)
+        tx.put(uid, [])
         return {"status": "ok"}
-    except HTTPException:
-        raise
+    return await submit_write(mutate, if_match, response, "Fehler beim Löschen")
+
+
+# ── Batch / Import / Export ──────────────────────────────────────────────────
+# Alle Änderungen eines Aufrufs werden in einem Read-Modify-Write angewendet:
+# ein Download (bzw. Cache-Treffer), ein Upload, ein HA-Reload. Schlägt eine
+# Operation fehl, wird nichts geschrieben.
+
+class BatchOp(BaseModel):
+    op: Literal["create", "update", "delete"]
+    uid: Optional[str] = None      # update/delete
+    event: Optional[EventIn] = None  # create/update
+
+
+def apply_batch(tx: WriteTx, ops: list[BatchOp]) -> dict:
+    created = []
+    for i, op in enumerate(ops):
+        if op.op != "delete" and op.event is None:
+            raise HTTPException(status_code=400, detail=f"Operation {i}: event fehlt")
+        try:
+            if op.op == "create":
+                component = new_event(op.event)
+                uid = str(component["UID"])
+                tx.put(uid, [component])
+                created.append(uid)
+                continue
+            if not op.uid:
+                raise HTTPException(status_code=400, detail=f"Operation {i}: uid fehlt")
+            # Spätere Operationen sehen die früheren derselben Batch
+            components = tx.components(op.uid)
+            if not components:
+                raise HTTPException(status_code=404, detail=f"Operation {i}: Ereignis {op.uid} nicht gefunden")
+            reject_series(components, f"Operation {i}: Ereignis {op.uid}")
+            if op.op == "update":
+                for component in components:
+                    apply_event_input(component, op.event)
+                tx.put(op.uid, components)
+            else:
+                tx.put(op.uid, [])
+        except ValueError as ex:
+            raise HTTPException(status_code=400, detail=f"Operation {i}: {ex}")
+    return {
+        "status": "ok",
+        "created": created,
+        "updated": sum(1 for op in ops if op.op == "update"),
+        "deleted": sum(1 for op in ops if op.op == "delete"),
+    }
+
+
+@app.post("/api/events/batch")
+async def batch_events(ops: list[BatchOp], response: Response, if_match: Optional[str] = Header(None)):
+    return await submit_write(lambda tx: apply_batch(tx, ops), if_match, response, "Fehler bei Batch")
+
+
+def parse_ics_import(body: bytes) -> tuple[dict, list]:
+    """
+    VEVENTs einer ICS-Datei nach UID (Events ohne UID bekommen eine neue) und
+    ihre VTIMEZONEs -- ohne diese wären eigene TZIDs (z.B. aus Outlook) in der
+    Kalenderdatei nicht mehr auflösbar.
+    """
+    try:
+        cal = Calendar.from_ical(body)
     except Exception as ex:
-        logger.error(f"Fehler beim Bearbeiten: {ex}")
-        raise HTTPException(status_code=500, detail=str(ex))
+        raise HTTPException(status_code=400, detail=f"Ungültige ICS-Datei: {ex}")
+    changes = {}
+    for component in cal.walk("VEVENT"):
+        if component.get("UID") is None:
+            component.add("UID", str(uuid.uuid4()))
+        changes.setdefault(str(component["UID"]), []).append(component)
+    return changes, cal.walk("VTIMEZONE")
 
 
-@app.delete("/api/events/{uid}")
-def delete_event(uid: str):
+def parse_csv_import(body: bytes) -> dict:
+    """
+    CSV mit Kopfzeile, Spalten wie EventIn (summary, start_date, optional
+    end_date, description, all_day, start_time, end_time). Trennzeichen , ; oder Tab.
+    """
+    text = body.decode("utf-8-sig")
     try:
-        content = ssh_read_ics()
-        cal = Calendar.from_ical(content)
-
-        new_cal = Calendar()
-        for attr in ["VERSION", "PRODID", "CALSCALE", "METHOD"]:
-            if cal.get(attr):
-                new_cal.add(attr, cal[attr])
-
-        deleted = False
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                if str(component.get("UID")) == uid:
-                    deleted = True
-                    continue
-                new_cal.add_component(component)
-            elif component.name != "VCALENDAR":
-                new_cal.add_component(component)
+        dialect = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    changes = {}
+    for line, row in enumerate(csv.DictReader(io.StringIO(text), dialect=dialect), 2):
+        row = {k.strip().lower(): v.strip() for k, v in row.items() if k and v and v.strip()}
+        if not row:
+            continue
+        try:
+            if "end_date" not in row and "start_date" in row:
+                row["end_date"] = (date.fromisoformat(row["start_date"]) + timedelta(days=1)).isoformat()
+            row.setdefault("all_day", "start_time" not in row)
+            component = new_event(EventIn(**row))
+        except (ValidationError, ValueError) as ex:
+            raise HTTPException(status_code=400, detail=f"Zeile {line}: {ex}")
+        changes[str(component["UID"])] = [component]
+    return changes
 
-        if not deleted:
-            raise HTTPException(status_code=404, detail="Ereignis nicht gefunden")
 
-        ssh_write_ics(new_cal.to_ical())
-        ha_reload_calendar()
-        return {"status": "ok"}
-    except HTTPException:
-        raise
+@app.post("/api/import")
+async def import_events(
+    request: Request,
+    response: Response,
+    format: Optional[Literal["ics", "csv"]] = None,
+    if_match: Optional[str] = Header(None),
+):
+    """
+    Importiert eine ICS- oder CSV-Datei (roher Request-Body). Das Format kommt
+    aus ?format= oder dem Content-Type. ICS-Events mit bekannter UID werden ersetzt,
+    VTIMEZONEs mit unbekannter TZID übernommen.
+    """
+    body = await request.body()
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ics"
+    changes, timezones = (parse_csv_import(body), []) if format == "csv" else parse_ics_import(body)
+    if not changes:
+        raise HTTPException(status_code=400, detail="Keine Ereignisse gefunden")
+
+    def mutate(tx: WriteTx):
+        for component in timezones:
+            tx.add_timezone(component)
+        for uid, components in changes.items():
+            tx.put(uid, components)
+        return {"status": "ok", "imported": len(changes)}
+    return await submit_write(mutate, if_match, response, "Fehler beim Import")
+
+
+EXPORT_CHUNK = 64 * 1024
+
+
+@app.get("/api/export")
+async def export_events(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+):
+    """
+    ICS-Export als Stream. Ohne from/to die Datei unverändert, sonst alle
+    VTIMEZONEs und nur die VEVENT-Blöcke (ganze Serien) mit Terminen in
+    [from, to) -- roh, ohne Neu-Serialisieren.
+    """
+    if date_from is not None or date_to is not None:
+        range_start, range_end = check_range(date_from, date_to)
+    try:
+        state = await asyncio.to_thread(load_state, date_from is not None)
+        if date_from is None:
+            content = state["content"]
+            chunks = (content[i:i + EXPORT_CHUNK] for i in range(0, len(content), EXPORT_CHUNK))
+        else:
+            uids = dict.fromkeys(e["uid"] for e in state["index"].overlapping(range_start, range_end))
+            chunks = state["blocks"].iter_blocks(uids)
     except Exception as ex:
-        logger.error(f"Fehler beim Löschen: {ex}")
+        logger.error(f"Fehler beim Export: {ex}")
         raise HTTPException(status_code=500, detail=str(ex))
+    return StreamingResponse(
+        chunks,
+        media_type="text/calendar; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="kalender.ics"', "ETag": state["etag"]},
+    )
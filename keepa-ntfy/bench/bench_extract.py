@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+bench_extract.py
+Micro-Benchmark fuer den Keepa-HTML-Extractor aus keepa-ntfy-poll.py.
+
+Vergleicht parse_keepa_html() (ein Durchlauf, vorkompiliertes Pattern)
+mit der frueheren Variante (vier re.search + Zeilen-Regex pro Aufruf)
+ueber einen Korpus gespeicherter Keepa-Mails (.eml oder .html).
+
+Aufruf:
+   python bench_extract.py                    # Beispiele aus samples/
+   python bench_extract.py ~/keepa-mails/ -n 2000
+"""
+
+import argparse
+import email
+import importlib.util
+import re
+import sys
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+
+def load_poller():
+    """Laedt keepa-ntfy-poll.py als Modul (Dateiname mit Bindestrich)."""
+    path = SCRIPT_DIR.parent / "keepa-ntfy-poll.py"
+    spec = importlib.util.spec_from_file_location("keepa_ntfy_poll", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_parse_keepa_html(html: str) -> dict:
+    """Fruehere Implementierung, nur als Vergleichsbasis."""
+    import html as html_mod
+    data = {}
+
+    m = re.search(r'src="(https://m\.media-amazon\.com/images/[^"]+)"', html)
+    if m:
+        data["product_image"] = html_mod.unescape(m.group(1))
+
+    m = re.search(r'src="(https://graph\.keepa\.com/[^"]+)"', html)
+    if m:
+        data["price_graph"] = html_mod.unescape(m.group(1))
+
+    m = re.search(r'href="(https://dyn[^"]*keepa\.com/r/[^"]+)"', html)
+    if m:
+        data["amazon_link"] = html_mod.unescape(m.group(1))
+
+    m = re.search(
+        r'href="https://dyn[^"]*keepa\.com/r/[^"]*"[^>]*>([^<]+)</a>',
+        html,
+    )
+    if m:
+        data["product_name"] = html_mod.unescape(m.group(1)).strip()
+
+    row_pattern = re.compile(
+        r'<tr>\s*'
+        r'<td[^>]*>([^<]*)</td>\s*'
+        r'<td[^>]*>([^<]*)</td>\s*'
+        r'<td[^>]*>([^<]*)</td>\s*'
+        r'<td[^>]*>(?:<[^>]*>)*([^<]*)(?:</[^>]*>)*</td>\s*'
+        r'<td[^>]*>([^<]*)</td>',
+        re.DOTALL,
+    )
+    rows = []
+    for rm in row_pattern.finditer(html):
+        rows.append({
+            "typ": html_mod.unescape(rm.group(1)).strip(),
+            "aktuell": html_mod.unescape(rm.group(2)).replace("\xa0", " ").strip(),
+            "wunsch": html_mod.unescape(rm.group(3)).replace("\xa0", " ").strip(),
+            "differenz": html_mod.unescape(rm.group(4)).replace("\xa0", " ").strip(),
+        })
+    if rows:
+        data["price_rows"] = rows
+
+    return data
+
+
+def load_corpus(poller, paths: list[Path]) -> list[str]:
+    """Liest alle .eml/.html-Dateien und liefert die HTML-Bodies."""
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files += sorted(p for p in path.iterdir() if p.suffix in (".eml", ".html"))
+        else:
+            files.append(path)
+
+    bodies = []
+    for f in files:
+        if f.suffix == ".eml":
+            html = poller.get_html_body(email.message_from_bytes(f.read_bytes()))
+        else:
+            html = f.read_text(encoding="utf-8", errors="replace")
+        if html:
+            bodies.append(html)
+    return bodies
+
+
+def as_dict(alert) -> dict:
+    """KeepaAlert in das alte Dict-Format umwandeln (fuer den Ergebnisvergleich)."""
+    data = {}
+    for name in ("product_image", "price_graph", "amazon_link", "product_name"):
+        if getattr(alert, name):
+            data[name] = getattr(alert, name)
+    if alert.price_rows:
+        data["price_rows"] = [vars(row) for row in alert.price_rows]
+    return data
+
+
+def bench(func, bodies: list[str], rounds: int) -> float:
+    """Mittlere Zeit pro Mail in Mikrosekunden."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for html in bodies:
+            func(html)
+    return (time.perf_counter() - start) / (rounds * len(bodies)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fuer parse_keepa_html()")
+    parser.add_argument("paths", nargs="*", type=Path, default=[SCRIPT_DIR / "samples"],
+                        help="Dateien oder Verzeichnisse mit .eml/.html (Standard: samples/)")
+    parser.add_argument("-n", "--rounds", type=int, default=500, help="Durchlaeufe ueber den Korpus")
+    args = parser.parse_args()
+
+    poller = load_poller()
+    bodies = load_corpus(poller, args.paths)
+    if not bodies:
+        print("Keine Keepa-Mails gefunden.")
+        sys.exit(1)
+
+    mismatches = sum(
+        1 for html in bodies
+        if as_dict(poller.parse_keepa_html(html)) != legacy_parse_keepa_html(html)
+    )
+
+    legacy_us = bench(legacy_parse_keepa_html, bodies, args.rounds)
+    new_us = bench(poller.parse_keepa_html, bodies, args.rounds)
+
+    total_kb = sum(len(html) for html in bodies) / 1024
+    print(f"Korpus:     {len(bodies)} Mail(s), {total_kb:.1f} KiB HTML, {args.rounds} Durchlaeufe")
+    print(f"Alt:        {legacy_us:8.1f} µs/Mail")
+    print(f"Neu:        {new_us:8.1f} µs/Mail")
+    print(f"Speedup:    {legacy_us / new_us:8.2f}x")
+    print(f"Abweichend: {mismatches} Mail(s)")
+
+
+if __name__ == "__main__":
+    main()
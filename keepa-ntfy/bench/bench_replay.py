@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+bench_replay.py
+Offline-Replay von keepa-ntfy-poll.py gegen lokale Stand-ins (fake_imap.py):
+ein Fake-IMAP-Server liefert aufgezeichnete Keepa-Mails aus, ein HTTP-Sink
+nimmt die ntfy-POSTs entgegen. Das Script laeuft unveraendert als
+Subprozess, konfiguriert nur ueber Environment-Variablen.
+
+Gemessen wird pro Backlog-Groesse:
+   - Durchsatz (Mails/s, inkl. Interpreter-Start)
+   - IMAP-Round-Trips pro Mail (Kommandos am Server)
+   - p50/p99 Latenz vom Start bis zur Ankunft der Notification
+     (--daemon: von der Einlieferung der Mail bis zur Notification, per IDLE)
+   - Peak RSS des Subprozesses (os.wait4)
+
+Aufruf:
+   python bench_replay.py                              # samples/, 10 / 1000 / 10000 Mails
+   python bench_replay.py ~/keepa-maildir/ --sizes 10 100
+   python bench_replay.py --daemon --sizes 50          # IDLE-Latenz einzelner Mails
+"""
+
+import argparse
+import math
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fake_imap import FakeIMAPServer, Mailbox, NtfySink, load_maildir
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+POLLER = SCRIPT_DIR.parent / "keepa-ntfy-poll.py"
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)] if ordered else float("nan")
+
+
+def poller_env(imap: FakeIMAPServer, sink: NtfySink, workdir: Path, extra: dict) -> dict:
+    """Environment fuer keepa-ntfy-poll.py: alles lokal, State in einem Temp-Verzeichnis."""
+    env = dict(os.environ)
+    env.update({
+        "IMAP_HOST": imap.server_address[0],
+        "IMAP_PORT": str(imap.server_address[1]),
+        "IMAP_USER": "bench",
+        "IMAP_PASS": "bench",
+        "NTFY_URL": sink.url,
+        "NTFY_TOKEN": "bench",
+        "STATE_FILE": str(workdir / "processed_uids.json"),
+        "RETRY_FILE": str(workdir / "retry_queue.json"),
+        "DIGEST_FILE": str(workdir / "digest_pending.json"),
+        "HISTORY_DB": str(workdir / "price_history.db"),
+        "LOG_LEVEL": "WARNING",
+    })
+    env.update(extra)
+    return env
+
+
+def wait_rss(proc: subprocess.Popen) -> tuple[int, float]:
+    """Wartet auf den Subprozess, liefert (Exit-Status, Peak RSS in MiB)."""
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, usage.ru_maxrss / 1024
+
+
+def run_backlog(corpus: list[bytes], size: int, extra_env: dict, idle: bool) -> dict:
+    """Einzellauf gegen ein Postfach mit `size` ungelesenen Keepa-Mails."""
+    mailbox = Mailbox()
+    for i in range(size):
+        mailbox.append(corpus[i % len(corpus)])
+    imap = FakeIMAPServer(mailbox, idle=idle).start()
+    sink = NtfySink().start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = poller_env(imap, sink, Path(workdir), extra_env)
+        start = time.monotonic()
+        proc = subprocess.Popen([sys.executable, str(POLLER)], env=env, stdout=subprocess.DEVNULL)
+        code, rss = wait_rss(proc)
+        wall = time.monotonic() - start
+
+    imap.shutdown()
+    sink.shutdown()
+    latencies = [received - start for received, _, _ in sink.received]
+    return {
+        "mails": size,
+        "delivered": len(sink.received),
+        "seen": sum(1 for mail in mailbox.mails if "\\Seen" in mail.flags),
+        "exit": code,
+        "rate": size / wall,
+        "round_trips": mailbox.round_trips() / size,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "rss": rss,
+        "connections": sink.connections,
+    }
+
+
+def run_daemon(corpus: list[bytes], size: int, extra_env: dict, idle: bool, timeout: float) -> dict:
+    """--daemon: Mails einzeln einliefern und die Zeit bis zur Notification messen."""
+    mailbox = Mailbox()
+    imap = FakeIMAPServer(mailbox, idle=idle).start()
+    sink = NtfySink().start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = poller_env(imap, sink, Path(workdir), extra_env)
+        start = time.monotonic()
+        proc = subprocess.Popen([sys.executable, str(POLLER), "--daemon"], env=env, stdout=subprocess.DEVNULL)
+
+        # Warten, bis der Daemon verbunden ist und zum ersten Mal wartet
+        wait_cmd = "IDLE" if idle else "NOOP"
+        while not mailbox.commands.get(wait_cmd) and proc.poll() is None:
+            time.sleep(0.01)
+
+        latencies = []
+        for i in range(size):
+            sent = time.monotonic()
+            mailbox.append(corpus[i % len(corpus)])
+            if not sink.wait_for(i + 1, timeout):
+                print(f"  Timeout: Mail {i + 1} nach {timeout}s nicht zugestellt", file=sys.stderr)
+                break
+            latencies.append(sink.received[i][0] - sent)
+        wall = time.monotonic() - start
+
+        # Das \Seen-Flag folgt der Zustellung erst mit dem naechsten STORE
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and any("\\Seen" not in mail.flags for mail in mailbox.mails):
+            time.sleep(0.01)
+        proc.send_signal(signal.SIGTERM)
+        code, rss = wait_rss(proc)
+
+    imap.shutdown()
+    sink.shutdown()
+    return {
+        "mails": size,
+        "delivered": len(sink.received),
+        "seen": sum(1 for mail in mailbox.mails if "\\Seen" in mail.flags),
+        "exit": code,
+        "rate": len(latencies) / wall,
+        "round_trips": mailbox.round_trips() / size,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "rss": rss,
+        "connections": sink.connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline-Replay/Benchmark fuer keepa-ntfy-poll.py")
+    parser.add_argument("maildir", nargs="?", type=Path, default=SCRIPT_DIR / "samples",
+                        help="aufgezeichnete Mails (.eml-Verzeichnis, Maildir oder Datei; Standard: samples/)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000],
+                        help="Backlog-Groessen (Standard: 10 1000 10000)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Daemon-Modus messen: Mails einzeln einliefern (IDLE-Latenz)")
+    parser.add_argument("--no-idle", action="store_true",
+                        help="Server ohne IDLE-Capability (Daemon faellt auf NOOP-Polling zurueck)")
+    parser.add_argument("--timeout", type=float, default=30, help="Max. Wartezeit pro Mail im Daemon-Modus")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="zusaetzliche Konfiguration fuer das Script, z.B. --env NTFY_WORKERS=8")
+    args = parser.parse_args()
+
+    corpus = load_maildir(args.maildir)
+    if not corpus:
+        print("Keine Mails gefunden.")
+        sys.exit(1)
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    if args.no_idle:
+        extra_env.setdefault("DAEMON_POLL_INTERVAL", "1")
+
+    mode = "Daemon (" + ("NOOP" if args.no_idle else "IDLE") + ")" if args.daemon else "Einzellauf"
+    print(f"Korpus: {len(corpus)} Mail(s), Modus: {mode}")
+    print(f"{'Mails':>7}  {'Mails/s':>8}  {'RT/Mail':>8}  {'p50 ms':>8}  {'p99 ms':>8}  "
+          f"{'RSS MiB':>8}  {'HTTP-Verb.':>10}  Zugestellt")
+
+    failed = False
+    for size in args.sizes:
+        if args.daemon:
+            r = run_daemon(corpus, size, extra_env, not args.no_idle, args.timeout)
+        else:
+            r = run_backlog(corpus, size, extra_env, not args.no_idle)
+        ok = r["delivered"] == r["seen"] == size
+        failed |= not ok
+        print(f"{r['mails']:>7}  {r['rate']:>8.1f}  {r['round_trips']:>8.3f}  {r['p50'] * 1000:>8.1f}  "
+              f"{r['p99'] * 1000:>8.1f}  {r['rss']:>8.1f}  {r['connections']:>10}  "
+              f"{r['delivered']}/{size}" + ("" if ok else f"  FEHLER (gelesen: {r['seen']}, exit {r['exit']})"))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
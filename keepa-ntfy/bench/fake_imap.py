@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+fake_imap.py
+Lokale Stand-ins fuer Benchmarks und Replays von keepa-ntfy-poll.py:
+
+- FakeIMAPServer: minimaler IMAP4rev1-Server (Plain, ein Postfach INBOX)
+  mit genau den Kommandos, die das Poll-Script nutzt: LOGIN, SELECT, NOOP,
+  IDLE, UID SEARCH (OR/NOT/UNSEEN/UID/FROM/SINCE), UID FETCH (BODYSTRUCTURE,
+  BODY[.PEEK][section]<o.n>, RFC822, FLAGS) und UID STORE.
+  Jedes Kommando wird in Mailbox.commands gezaehlt (= Round-Trips),
+  Mailbox.on_command(cmd, n) wird vor dem n-ten Aufruf von cmd ausgefuehrt.
+- NtfySink: HTTP-Server, der jeden POST mit Zeitstempel aufzeichnet und
+  mit 200 antwortet (zaehlt auch TCP-Verbindungen, fuer Keep-Alive).
+
+Direkt aufgerufen laeuft ein Regressionstest gegen keepa-ntfy-poll.py:
+   python fake_imap.py [samples/keepa-alert-1.eml]
+
+Kein Ersatz fuer einen echten Server -- Fehlerfaelle und Literale in
+Kommandos werden nicht unterstuetzt.
+"""
+
+import email
+import re
+import select
+import socketserver
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def load_maildir(path: Path) -> list[bytes]:
+    """Liest aufgezeichnete Mails: .eml-Dateien oder ein Maildir (cur/ und new/)."""
+    if path.is_file():
+        return [path.read_bytes()]
+    files = sorted(p for p in path.iterdir() if p.suffix == ".eml")
+    for sub in ("cur", "new"):
+        if (path / sub).is_dir():
+            files += sorted(p for p in (path / sub).iterdir() if p.is_file())
+    return [f.read_bytes() for f in files]
+
+
+# ──────────────────────────────────────────────
+# Postfach
+# ──────────────────────────────────────────────
+def quote(s) -> str:
+    return '"' + str(s).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def part_bytes(part: email.message.Message) -> bytes:
+    """Rohbytes eines MIME-Teils (Body ohne Header), mit CRLF."""
+    payload = part.get_payload()
+    if isinstance(payload, str):
+        return payload.encode("utf-8", "surrogateescape").replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+    return part.as_bytes()
+
+
+def bodystructure(part: email.message.Message) -> str:
+    """BODYSTRUCTURE nach RFC 3501 (ohne Extension-Daten)."""
+    if part.is_multipart():
+        subs = "".join(bodystructure(p) for p in part.get_payload())
+        return f"({subs} {quote(part.get_content_subtype().upper())})"
+    maintype, subtype = part.get_content_maintype(), part.get_content_subtype()
+    params = part.get_params()[1:] if part.get_params() else []
+    plist = "(" + " ".join(f"{quote(k.upper())} {quote(v)}" for k, v in params) + ")" if params else "NIL"
+    enc = part.get("Content-Transfer-Encoding", "7bit").upper()
+    body = part_bytes(part)
+    base = f"({quote(maintype.upper())} {quote(subtype.upper())} {plist} NIL NIL {quote(enc)} {len(body)}"
+    if maintype == "text":
+        base += " %d" % body.count(b"\n")
+    return base + ")"
+
+
+def get_part(msg: email.message.Message, spec: str) -> email.message.Message | None:
+    cur = msg
+    for n in spec.split("."):
+        n = int(n)
+        if cur.is_multipart():
+            cur = cur.get_payload()[n - 1]
+        elif n != 1:
+            return None
+    return cur
+
+
+class Message:
+    """Geparste Mail; mehrfach eingelieferte identische Mails teilen sich eine Instanz."""
+
+    def __init__(self, raw: bytes):
+        self.raw = raw.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+        self.msg = email.message_from_bytes(self.raw)
+        self.head = self.raw.partition(b"\r\n\r\n")[0]
+        self.bs = bodystructure(self.msg)
+
+
+class Mail:
+    def __init__(self, uid: int, message: Message, date_: date):
+        self.uid = uid
+        self.message = message
+        self.flags = set()
+        self.date = date_
+
+
+class Mailbox:
+    def __init__(self, uidvalidity: int = 1):
+        self.uidvalidity = uidvalidity
+        self.mails = []
+        self.next_uid = 1
+        self.cond = threading.Condition()
+        self.commands = {}
+        self.on_command = None
+        self._messages = {}
+
+    def append(self, raw: bytes, date_: date | None = None) -> Mail:
+        """Liefert eine Mail ein (weckt wartende IDLE-Verbindungen)."""
+        with self.cond:
+            message = self._messages.get(raw)
+            if message is None:
+                message = self._messages[raw] = Message(raw)
+            mail = Mail(self.next_uid, message, date_ or date.today())
+            self.next_uid += 1
+            self.mails.append(mail)
+            self.cond.notify_all()
+            return mail
+
+    def round_trips(self) -> int:
+        with self.cond:
+            return sum(self.commands.values())
+
+
+# ──────────────────────────────────────────────
+# IMAP-Server
+# ──────────────────────────────────────────────
+def parse_set(s: str, maxv: int) -> list[tuple[int, int]]:
+    out = []
+    for part in s.split(","):
+        a, _, b = part.partition(":")
+        a = maxv if a == "*" else int(a)
+        b = a if not b else (maxv if b == "*" else int(b))
+        out.append((min(a, b), max(a, b)))
+    return out
+
+
+def in_set(v: int, ranges: list[tuple[int, int]]) -> bool:
+    return any(a <= v <= b for a, b in ranges)
+
+
+TOKEN_RE = re.compile(r'\s*("(?:[^"\\]|\\.)*"|\(|\)|[^\s()]+)')
+ITEM_RE = re.compile(r"(BODY(?:\.PEEK)?)\[([^\]]*)\](?:<(\d+)\.(\d+)>)?|RFC822|BODYSTRUCTURE|UID|FLAGS")
+
+
+def tokens(s: str) -> list[str]:
+    return [t[1:-1] if t.startswith('"') else t for t in TOKEN_RE.findall(s)]
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+    known = 0
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def handle(self):
+        mb = self.server.mailbox
+        caps = "IMAP4rev1" + (" IDLE" if self.server.idle else "")
+        self.send(f"* OK [CAPABILITY {caps}] fake ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+            cmd, _, args = rest.partition(" ")
+            cmd = cmd.upper()
+            if cmd == "UID":
+                sub, _, args = args.partition(" ")
+                cmd = "UID " + sub.upper()
+            with mb.cond:
+                mb.commands[cmd] = mb.commands.get(cmd, 0) + 1
+                count = mb.commands[cmd]
+            if mb.on_command:
+                # Test-Hook: laeuft vor der Ausfuehrung, z.B. um Mails dazwischenzuschieben
+                mb.on_command(cmd, count)
+
+            if cmd == "CAPABILITY":
+                self.send(f"* CAPABILITY {caps}\r\n{tag} OK done\r\n")
+            elif cmd == "LOGIN":
+                self.send(f"{tag} OK logged in\r\n")
+            elif cmd in ("SELECT", "EXAMINE"):
+                with mb.cond:
+                    self.known = len(mb.mails)
+                    self.send(f"* {self.known} EXISTS\r\n* 0 RECENT\r\n"
+                              f"* OK [UIDVALIDITY {mb.uidvalidity}] ok\r\n"
+                              f"* OK [UIDNEXT {mb.next_uid}] ok\r\n{tag} OK [READ-WRITE] selected\r\n")
+            elif cmd == "NOOP":
+                self.report_exists()
+                self.send(f"{tag} OK noop\r\n")
+            elif cmd == "IDLE":
+                self.idle(tag)
+            elif cmd == "UID SEARCH":
+                self.search(tag, args)
+            elif cmd == "UID FETCH":
+                self.fetch(tag, args)
+            elif cmd == "UID STORE":
+                self.store(tag, args)
+            elif cmd == "CLOSE":
+                self.send(f"{tag} OK closed\r\n")
+            elif cmd == "LOGOUT":
+                self.send(f"* BYE\r\n{tag} OK bye\r\n")
+                return
+            else:
+                self.send(f"{tag} BAD unknown command\r\n")
+
+    def snapshot(self) -> tuple[list[Mail], int]:
+        with self.server.mailbox.cond:
+            mails = list(self.server.mailbox.mails)
+        return mails, (mails[-1].uid if mails else 0)
+
+    def report_exists(self):
+        with self.server.mailbox.cond:
+            n = len(self.server.mailbox.mails)
+        if n != self.known:
+            self.known = n
+            self.send(f"* {n} EXISTS\r\n")
+
+    def idle(self, tag: str):
+        """IDLE: neue Mails sofort als EXISTS melden, bis der Client DONE schickt."""
+        mb = self.server.mailbox
+        self.send("+ idling\r\n")
+        while True:
+            # Socket-Timeouts wuerden die gepufferte rfile unbrauchbar machen, daher select()
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            if readable:
+                if not self.rfile.readline():
+                    return
+                break
+            with mb.cond:
+                if len(mb.mails) == self.known:
+                    mb.cond.wait(0.05)
+            self.report_exists()
+        self.send(f"{tag} OK idle done\r\n")
+
+    def match(self, mail: Mail, toks: list[str], i: int, maxuid: int) -> tuple[bool, int]:
+        t = toks[i].upper()
+        if t == "OR":
+            a, i = self.match(mail, toks, i + 1, maxuid)
+            b, i = self.match(mail, toks, i, maxuid)
+            return a or b, i
+        if t == "NOT":
+            a, i = self.match(mail, toks, i + 1, maxuid)
+            return not a, i
+        if t == "UNSEEN":
+            return "\\Seen" not in mail.flags, i + 1
+        if t == "ALL":
+            return True, i + 1
+        if t == "UID":
+            return in_set(mail.uid, parse_set(toks[i + 1], maxuid)), i + 2
+        if t == "FROM":
+            return toks[i + 1].lower() in mail.message.msg.get("From", "").lower(), i + 2
+        if t == "SINCE":
+            d, mo, y = toks[i + 1].split("-")
+            return mail.date >= date(int(y), MONTHS.index(mo) + 1, int(d)), i + 2
+        raise ValueError(f"SEARCH-Kriterium nicht unterstuetzt: {t}")
+
+    def search(self, tag: str, args: str):
+        toks = tokens(args)
+        mails, maxuid = self.snapshot()
+        result = []
+        for mail in mails:
+            i, ok = 0, True
+            while i < len(toks) and ok:
+                ok, i = self.match(mail, toks, i, maxuid)
+            if ok:
+                result.append(str(mail.uid))
+        self.send(f"* SEARCH {' '.join(result)}\r\n{tag} OK search done\r\n")
+
+    def fetch(self, tag: str, args: str):
+        seqset, _, query = args.partition(" ")
+        mails, maxuid = self.snapshot()
+        ranges = parse_set(seqset, maxuid)
+        items = list(ITEM_RE.finditer(query.upper()))
+        for seq, mail in enumerate(mails, 1):
+            if not in_set(mail.uid, ranges):
+                continue
+            out = [f"UID {mail.uid}".encode()]
+            for item in items:
+                word = item.group(0)
+                if word == "UID":
+                    continue
+                if word == "FLAGS":
+                    out.append(f"FLAGS ({' '.join(sorted(mail.flags))})".encode())
+                elif word == "BODYSTRUCTURE":
+                    out.append(b"BODYSTRUCTURE " + mail.message.bs.encode())
+                elif word == "RFC822":
+                    mail.flags.add("\\Seen")
+                    out.append(f"RFC822 {{{len(mail.message.raw)}}}\r\n".encode() + mail.message.raw)
+                else:
+                    section = item.group(2)
+                    data = self.section(mail.message, section)
+                    name = f"BODY[{section}]"
+                    if item.group(1) == "BODY":
+                        mail.flags.add("\\Seen")
+                    if item.group(3) is not None:
+                        offset, size = int(item.group(3)), int(item.group(4))
+                        data = data[offset:offset + size]
+                        name += f"<{offset}>"
+                    out.append(f"{name} {{{len(data)}}}\r\n".encode() + data)
+            self.send(f"* {seq} FETCH (".encode() + b" ".join(out) + b")\r\n")
+        self.send(f"{tag} OK fetch done\r\n")
+
+    def section(self, message: Message, section: str) -> bytes:
+        s = section.upper()
+        if s == "":
+            return message.raw
+        if s == "HEADER":
+            return message.head + b"\r\n\r\n"
+        if s == "TEXT":
+            return message.raw.partition(b"\r\n\r\n")[2]
+        if s.startswith("HEADER.FIELDS"):
+            wanted = re.findall(r"[A-Z0-9-]+", s[len("HEADER.FIELDS"):])
+            lines = [
+                f"{name.capitalize()}: {value}"
+                for name in wanted
+                for value in message.msg.get_all(name, [])
+            ]
+            return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8", "replace")
+        part = get_part(message.msg, section)
+        return part_bytes(part) if part is not None else b""
+
+    def store(self, tag: str, args: str):
+        seqset, op, flags = args.split(" ", 2)
+        mails, maxuid = self.snapshot()
+        ranges = parse_set(seqset, maxuid)
+        flagset = set(flags.strip("()").split())
+        for mail in mails:
+            if in_set(mail.uid, ranges):
+                if op.startswith("+"):
+                    mail.flags |= flagset
+                elif op.startswith("-"):
+                    mail.flags -= flagset
+        self.send(f"{tag} OK store done\r\n")
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox: Mailbox, idle: bool = True, addr=("127.0.0.1", 0)):
+        super().__init__(addr, IMAPHandler)
+        self.mailbox = mailbox
+        self.idle = idle
+
+    def start(self) -> "FakeIMAPServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+# ──────────────────────────────────────────────
+# ntfy-Sink
+# ──────────────────────────────────────────────
+class NtfyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.cond:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        with self.server.cond:
+            self.server.received.append((time.monotonic(), self.headers.get("Title", ""), body))
+            self.server.cond.notify_all()
+
+    def log_message(self, *args):
+        pass
+
+
+class NtfySink(ThreadingHTTPServer):
+    """Nimmt ntfy-POSTs an und merkt sich (Empfangszeit, Titel, Body)."""
+    daemon_threads = True
+
+    def __init__(self, status: int = 200, addr=("127.0.0.1", 0)):
+        super().__init__(addr, NtfyHandler)
+        self.status = status
+        self.received = []
+        self.connections = 0
+        self.cond = threading.Condition()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> "NtfySink":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def wait_for(self, count: int, timeout: float) -> bool:
+        """Wartet, bis insgesamt `count` POSTs angekommen sind."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while len(self.received) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+
+# ──────────────────────────────────────────────
+# Regressionstests
+# ──────────────────────────────────────────────
+def check_search_race(raw: bytes) -> bool:
+    """
+    Eine Keepa-Mail, die zwischen den beiden UID SEARCHes des serverseitigen
+    Filters ankommt, darf nicht hinter last_uid verschwinden: nach zwei
+    Einzellaeufen muessen beide Mails zugestellt und gelesen sein.
+    """
+    import subprocess
+    import sys
+    import tempfile
+
+    from bench_replay import POLLER, poller_env
+
+    mailbox = Mailbox()
+    mailbox.append(raw)
+
+    def inject(cmd: str, count: int):
+        if cmd == "UID SEARCH" and count == 2:
+            mailbox.append(raw)
+
+    mailbox.on_command = inject
+    imap = FakeIMAPServer(mailbox).start()
+    sink = NtfySink().start()
+    with tempfile.TemporaryDirectory() as workdir:
+        env = poller_env(imap, sink, Path(workdir), {"SERVER_SIDE_FILTER": "1"})
+        for _ in range(2):
+            subprocess.run([sys.executable, str(POLLER)], env=env, stdout=subprocess.DEVNULL, check=True)
+    imap.shutdown()
+    sink.shutdown()
+
+    seen = [mail.uid for mail in mailbox.mails if "\\Seen" in mail.flags]
+    ok = len(mailbox.mails) == 2 and len(seen) == 2
+    print(f"Mail zwischen zwei UID SEARCHes: {'OK' if ok else 'FEHLER'} "
+          f"(gelesen: {seen}, POSTs: {len(sink.received)})")
+    return ok
+
+
+if __name__ == "__main__":
+    import sys
+
+    sample = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).resolve().parent / "samples"
+    sys.exit(0 if check_search_race(load_maildir(sample)[0]) else 1)
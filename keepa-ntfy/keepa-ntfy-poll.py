@@ -4,21 +4,36 @@ keepa-ntfy-poll.py
 Pollt Outlook (via OAuth2-Proxy) per IMAP auf Keepa-Preisalarme
 und pusht sie als Notification an ntfy.
 
-Laeuft als systemd-Timer im ntfy LXC.
+Laeuft als systemd-Timer im ntfy LXC, oder mit --daemon dauerhaft
+mit einer offenen IMAP-Verbindung (IDLE bzw. NOOP-Polling).
 """
 
+import argparse
+import base64
+import html as html_mod
 import imaplib
 import email
 import email.header
+import email.parser
+import email.message
 import re
 import json
-import urllib.request
-import urllib.error
+import http.client
+import urllib.parse
 import ssl
 import sys
 import os
 import logging
-from datetime import datetime
+import quopri
+import select
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from dataclasses import dataclass, field, fields
+from datetime import datetime, date, timedelta
 from email.utils import parseaddr
 from pathlib import Path
 
@@ -34,12 +49,57 @@ NTFY_URL      = os.getenv("NTFY_URL", "http://ntfy.home.intern")
 NTFY_TOPIC    = os.getenv("NTFY_TOPIC", "keepa")
 NTFY_TOKEN    = os.getenv("NTFY_TOKEN", "")  # Bearer Token
 
+# Parallele ntfy-Sends (jeder Worker haelt eine Keep-Alive-Verbindung)
+NTFY_WORKERS  = int(os.getenv("NTFY_WORKERS", "4"))
+
+# Maximale Body-Groesse einer ntfy-Nachricht (Zeichen)
+NTFY_MAX_BODY = 4000
+
+# Digest-Modus: Alerts eines Poll-Laufs (bzw. eines Zeitfensters in Sekunden)
+# zu einer Notification zusammenfassen, doppelte Produkte nur einmal
+DIGEST_MODE   = os.getenv("DIGEST_MODE", "0") == "1"
+DIGEST_WINDOW = int(os.getenv("DIGEST_WINDOW", "0"))
+
 # Keepa Absender-Adressen (werden case-insensitive geprueft)
 KEEPA_SENDERS = ["pricealert@keepa.com", "noreply@keepa.com", "alerts@keepa.com"]
 
-# Statefile: speichert UIDs bereits verarbeiteter Mails
+# Absenderfilter per IMAP SEARCH auf dem Server (0 = clientseitig, fuer Server mit kaputtem SEARCH)
+SERVER_SIDE_FILTER = os.getenv("SERVER_SIDE_FILTER", "1") == "1"
+
+# Nur Mails der letzten N Tage durchsuchen (0 = keine Begrenzung)
+SEARCH_SINCE_DAYS = int(os.getenv("SEARCH_SINCE_DAYS", "0"))
+
+# Statefile: speichert UIDVALIDITY und die hoechste verarbeitete UID
 STATE_FILE    = Path(os.getenv("STATE_FILE", "/var/lib/keepa-ntfy/processed_uids.json"))
 
+# Retry-Queue: Notifications, die ntfy nicht bestaetigt hat (naechster Lauf sendet erneut)
+RETRY_FILE    = Path(os.getenv("RETRY_FILE", "/var/lib/keepa-ntfy/retry_queue.json"))
+# Nach so vielen fehlgeschlagenen Versuchen wird eine Notification verworfen
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "20"))
+
+# Digest-Modus: gesammelte, noch nicht gesendete Alerts (bei DIGEST_WINDOW > 0)
+DIGEST_FILE   = Path(os.getenv("DIGEST_FILE", "/var/lib/keepa-ntfy/digest_pending.json"))
+
+# Preishistorie: jede geparste Preiszeile landet in SQLite (leer = deaktiviert),
+# die Notification zeigt den Tiefstpreis der letzten HISTORY_DAYS Tage
+HISTORY_DB    = os.getenv("HISTORY_DB", "/var/lib/keepa-ntfy/price_history.db")
+HISTORY_DAYS  = int(os.getenv("HISTORY_DAYS", "90"))
+
+# Maximale Anzahl UIDs pro FETCH/STORE-Kommando (begrenzt die Zeilenlaenge)
+FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", "200"))
+
+# Blockgroesse fuer den Fallback, der Mails stueckweise holt (bis der HTML-Teil komplett ist)
+PARTIAL_FETCH_SIZE = int(os.getenv("PARTIAL_FETCH_SIZE", "65536"))
+
+# Socket-Timeout fuer IMAP-Antworten: eine halbtote Verbindung fuehrt zum Reconnect statt zum Haengen
+IMAP_TIMEOUT = int(os.getenv("IMAP_TIMEOUT", "60"))
+
+# Daemon-Modus: IDLE nach N Sekunden erneuern (RFC 2177: < 29 Min),
+# NOOP-Intervall falls der Server kein IDLE kann, max. Reconnect-Backoff
+IDLE_TIMEOUT         = int(os.getenv("IDLE_TIMEOUT", "1500"))
+DAEMON_POLL_INTERVAL = int(os.getenv("DAEMON_POLL_INTERVAL", "60"))
+DAEMON_MAX_BACKOFF   = int(os.getenv("DAEMON_MAX_BACKOFF", "300"))
+
 # Logging
 LOG_LEVEL     = os.getenv("LOG_LEVEL", "INFO")
 
@@ -54,24 +114,194 @@ logging.basicConfig(
 log = logging.getLogger("keepa-ntfy")
 
 
-def load_processed_uids() -> set:
-    """Laedt bereits verarbeitete Mail-UIDs aus dem State-File."""
+def load_state() -> dict:
+    """
+    Laedt den Poll-State: UIDVALIDITY der Mailbox und hoechste verarbeitete UID.
+    Alte State-Files mit UID-Liste werden uebernommen (hoechste UID zaehlt).
+    """
+    state = {"uidvalidity": None, "last_uid": 0}
     if STATE_FILE.exists():
         try:
             data = json.loads(STATE_FILE.read_text())
-            return set(data.get("uids", []))
-        except (json.JSONDecodeError, KeyError):
+            if "uids" in data:
+                state["last_uid"] = max((int(u) for u in data["uids"]), default=0)
+            else:
+                state["uidvalidity"] = data.get("uidvalidity")
+                state["last_uid"] = int(data.get("last_uid", 0))
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError):
             log.warning("State-File korrupt, starte mit leerem State")
-    return set()
+    return state
 
 
-def save_processed_uids(uids: set):
-    """Speichert verarbeitete UIDs ins State-File."""
-    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    STATE_FILE.write_text(json.dumps({
-        "uids": list(uids),
+def write_json_atomic(path: Path, data):
+    """Schreibt JSON atomar (Temp-File + Rename), Leser sehen nie ein halbes File."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save_state(state: dict):
+    """Schreibt den Poll-State atomar ins State-File."""
+    write_json_atomic(STATE_FILE, {
+        "uidvalidity": state["uidvalidity"],
+        "last_uid": state["last_uid"],
         "updated": datetime.now().isoformat(),
-    }, indent=2))
+    })
+
+
+def load_retry_queue() -> list[dict]:
+    """Laedt noch nicht zugestellte Notifications aus der Retry-Queue."""
+    if RETRY_FILE.exists():
+        try:
+            return json.loads(RETRY_FILE.read_text()).get("jobs", [])
+        except (json.JSONDecodeError, AttributeError):
+            log.warning("Retry-Queue korrupt, wird verworfen")
+    return []
+
+
+def save_retry_queue(jobs: list[dict]):
+    """Speichert die Retry-Queue atomar; leere Queue loescht das File."""
+    if not jobs:
+        RETRY_FILE.unlink(missing_ok=True)
+        return
+    write_json_atomic(RETRY_FILE, {
+        "jobs": jobs,
+        "updated": datetime.now().isoformat(),
+    })
+
+
+def load_digest_pending() -> list[dict]:
+    """Laedt die fuer den naechsten Digest gesammelten Alerts."""
+    if DIGEST_FILE.exists():
+        try:
+            return json.loads(DIGEST_FILE.read_text()).get("jobs", [])
+        except (json.JSONDecodeError, AttributeError):
+            log.warning("Digest-File korrupt, wird verworfen")
+    return []
+
+
+def save_digest_pending(jobs: list[dict]):
+    """Speichert gesammelte Alerts atomar; ohne Alerts wird das File geloescht."""
+    if not jobs:
+        DIGEST_FILE.unlink(missing_ok=True)
+        return
+    write_json_atomic(DIGEST_FILE, {"jobs": jobs})
+
+
+def digest_due_in(jobs: list[dict]) -> float | None:
+    """Sekunden bis der Digest faellig ist (<= 0: jetzt), None ohne gesammelte Alerts."""
+    if not jobs:
+        return None
+    oldest = min(job["collected"] for job in jobs)
+    return oldest + DIGEST_WINDOW - time.time()
+
+
+def uid_set(uids: list[str]) -> str:
+    """Fasst UIDs zu einem kompakten IMAP-Sequence-Set zusammen (z.B. "3:7,12")."""
+    nums = sorted({int(u) for u in uids})
+    ranges = []
+    start = prev = None
+    for n in nums:
+        if start is None:
+            start = prev = n
+        elif n == prev + 1:
+            prev = n
+        else:
+            ranges.append(f"{start}:{prev}" if prev != start else str(start))
+            start = prev = n
+    if start is not None:
+        ranges.append(f"{start}:{prev}" if prev != start else str(start))
+    return ",".join(ranges)
+
+
+def chunks(items: list, size: int):
+    """Teilt eine Liste in Bloecke von maximal `size` Elementen."""
+    for i in range(0, len(items), max(size, 1)):
+        yield items[i:i + size]
+
+
+FETCH_UID_RE = re.compile(rb"\bUID (\d+)")
+
+
+def uid_fetch_many(imap: imaplib.IMAP4, uids: list[str], query: str) -> dict[str, bytes]:
+    """
+    Holt ein FETCH-Item fuer viele UIDs mit einem Kommando pro Block.
+    Liefert {uid: literal-bytes}; UIDs ohne Antwort fehlen im Ergebnis.
+    """
+    result = {}
+    for block in chunks(uids, FETCH_CHUNK_SIZE):
+        status, data = imap.uid("FETCH", uid_set(block), query)
+        if status != "OK":
+            log.warning(f"IMAP FETCH {query} fehlgeschlagen: {status}")
+            continue
+        for i, item in enumerate(data):
+            if not isinstance(item, tuple):
+                continue
+            m = FETCH_UID_RE.search(item[0])
+            # Manche Server senden "UID n" erst nach dem Literal
+            if not m and i + 1 < len(data) and isinstance(data[i + 1], bytes):
+                m = FETCH_UID_RE.search(data[i + 1])
+            if m:
+                result[m.group(1).decode()] = item[1]
+    return result
+
+
+def uid_mark_seen(imap: imaplib.IMAP4, uids: list[str]):
+    """Setzt \\Seen fuer alle UIDs mit einem STORE pro Block."""
+    for block in chunks(uids, FETCH_CHUNK_SIZE):
+        status, _ = imap.uid("STORE", uid_set(block), "+FLAGS", "\\Seen")
+        if status != "OK":
+            log.warning(f"IMAP STORE fehlgeschlagen fuer {len(block)} Mail(s): {status}")
+
+
+def imap_date(d: date) -> str:
+    """Formatiert ein Datum fuer IMAP SEARCH (z.B. 15-Mar-2026), unabhaengig von der Locale."""
+    months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+              "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    return f"{d.day}-{months[d.month - 1]}-{d.year}"
+
+
+def build_search_criteria(server_filter: bool, min_uid: int = 1) -> list[str]:
+    """
+    Baut die Kriterien fuer UID SEARCH: UID min_uid:*, UNSEEN, optional SINCE
+    und (serverseitig) ein verschachteltes OR FROM ... ueber KEEPA_SENDERS.
+    """
+    criteria = ["UID", f"{min_uid}:*", "UNSEEN"]
+    if SEARCH_SINCE_DAYS > 0:
+        since = date.today() - timedelta(days=SEARCH_SINCE_DAYS)
+        criteria += ["SINCE", imap_date(since)]
+    if server_filter and KEEPA_SENDERS:
+        # OR ist binaer: OR OR FROM a FROM b FROM c
+        criteria += ["OR"] * (len(KEEPA_SENDERS) - 1)
+        for sender in KEEPA_SENDERS:
+            criteria += ["FROM", f'"{sender}"']
+    return criteria
+
+
+def uid_search(imap: imaplib.IMAP4, criteria: list[str], min_uid: int = 1) -> list[str] | None:
+    """Fuehrt UID SEARCH aus, liefert die UIDs >= min_uid oder None bei Fehler."""
+    status, data = imap.uid("SEARCH", None, *criteria)
+    if status != "OK":
+        log.warning(f"IMAP SEARCH {' '.join(criteria)} fehlgeschlagen: {status}")
+        return None
+    uids = data[0].split() if data and data[0] else []
+    # "UID n:*" liefert immer mindestens die letzte Mail, auch wenn deren UID < n ist
+    return [u.decode() for u in uids if int(u) >= min_uid]
+
+
+def get_uidvalidity(imap: imaplib.IMAP4) -> int | None:
+    """Liest UIDVALIDITY aus der Antwort des letzten SELECT."""
+    _, data = imap.response("UIDVALIDITY")
+    try:
+        return int(data[0])
+    except (TypeError, ValueError, IndexError):
+        return None
 
 
 def decode_header_value(raw: str) -> str:
@@ -99,99 +329,443 @@ def get_html_body(msg: email.message.Message) -> str | None:
     return None
 
 
-def parse_keepa_html(html: str) -> dict:
-    """Parst die Keepa-Mail und extrahiert die wesentlichen Elemente."""
-    import html as html_mod
-    data = {}
+@dataclass
+class PriceRow:
+    """Eine Zeile der Keepa-Preistabelle."""
+    typ: str
+    aktuell: str
+    wunsch: str
+    differenz: str
 
-    # 1. Produktbild (Amazon)
-    m = re.search(r'src="(https://m\.media-amazon\.com/images/[^"]+)"', html)
-    if m:
-        data["product_image"] = html_mod.unescape(m.group(1))
 
-    # 2. Preisgraph (Keepa)
-    m = re.search(r'src="(https://graph\.keepa\.com/[^"]+)"', html)
-    if m:
-        data["price_graph"] = html_mod.unescape(m.group(1))
+@dataclass
+class KeepaAlert:
+    """Aus einer Keepa-Mail extrahierte Daten."""
+    product_image: str | None = None
+    price_graph: str | None = None
+    amazon_link: str | None = None
+    product_name: str | None = None
+    price_rows: list[PriceRow] = field(default_factory=list)
 
-    # 3. Amazon-Link (Keepa redirect)
-    m = re.search(r'href="(https://dyn[^"]*keepa\.com/r/[^"]+)"', html)
+    def found_fields(self) -> list[str]:
+        """Namen der gefundenen (nicht leeren) Felder, fuers Debug-Log."""
+        return [f.name for f in fields(self) if getattr(self, f.name)]
+
+
+# ──────────────────────────────────────────────
+# MIME: nur den text/html-Teil vom Server holen
+# ──────────────────────────────────────────────
+IMAP_TOKEN_RE = re.compile(
+    rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}$|([^\s()"\[]+(?:\[[^\]]*\][^\s()"]*)?))'
+)
+
+
+def imap_tokens(data: list) -> list:
+    """
+    Zerlegt eine imaplib-FETCH-Antwort (Bytes und (Kopf, Literal)-Tupel)
+    in Tokens: "(", ")", Atome/Strings als bytes, NIL als None, Literale als bytes.
+    """
+    tokens = []
+    for item in data:
+        head, literal = item if isinstance(item, tuple) else (item, None)
+        pos = 0
+        while pos < len(head):
+            m = IMAP_TOKEN_RE.match(head, pos)
+            if not m or m.end() == pos:
+                break
+            pos = m.end()
+            if m.group(1):
+                tokens.append("(")
+            elif m.group(2):
+                tokens.append(")")
+            elif m.group(3) is not None:
+                tokens.append(re.sub(rb"\\(.)", rb"\1", m.group(3)))
+            elif m.group(4) is not None:
+                tokens.append(literal if literal is not None else b"")
+            elif m.group(5) is not None:
+                tokens.append(None if m.group(5).upper() == b"NIL" else m.group(5))
+    return tokens
+
+
+def imap_parse_list(tokens: list, pos: int) -> tuple[list, int]:
+    """Parst eine geklammerte Liste ab tokens[pos] == "(" (verschachtelt)."""
+    result = []
+    pos += 1
+    while pos < len(tokens) and tokens[pos] != ")":
+        if tokens[pos] == "(":
+            sub, pos = imap_parse_list(tokens, pos)
+            result.append(sub)
+        else:
+            result.append(tokens[pos])
+            pos += 1
+    return result, pos + 1
+
+
+def uid_fetch_items(imap: imaplib.IMAP4, uids: list[str], query: str) -> dict[str, dict]:
+    """
+    Wie uid_fetch_many, liefert aber alle FETCH-Items je UID geparst:
+    {uid: {b"BODYSTRUCTURE": [...], b"BODY[...]": b"...", ...}}
+    """
+    result = {}
+    for block in chunks(uids, FETCH_CHUNK_SIZE):
+        status, data = imap.uid("FETCH", uid_set(block), query)
+        if status != "OK":
+            log.warning(f"IMAP FETCH {query} fehlgeschlagen: {status}")
+            continue
+        tokens = imap_tokens([d for d in data if d is not None])
+        pos = 0
+        # Antwort: <seq> (<name> <wert> <name> <wert> ...) <seq> (...)
+        while pos < len(tokens):
+            if tokens[pos] != "(":
+                pos += 1
+                continue
+            items, pos = imap_parse_list(tokens, pos)
+            fetched = {
+                items[i].upper(): items[i + 1]
+                for i in range(0, len(items) - 1, 2)
+                if isinstance(items[i], bytes)
+            }
+            uid = fetched.get(b"UID")
+            if uid:
+                result[uid.decode()] = fetched
+    return result
+
+
+def find_html_part(body: list, path: str = "") -> tuple[str, str, str | None] | None:
+    """
+    Sucht in einer geparsten BODYSTRUCTURE den ersten text/html-Teil.
+    Liefert (Part-Nummer, Content-Transfer-Encoding, Charset) oder None.
+    """
+    if not body:
+        return None
+    if isinstance(body[0], list):
+        # Multipart: Kind-Teile zuerst, danach Subtype und Erweiterungen
+        index = 0
+        for sub in body:
+            if not isinstance(sub, list):
+                break
+            index += 1
+            found = find_html_part(sub, f"{path}.{index}" if path else str(index))
+            if found:
+                return found
+        return None
+
+    ctype = (body[0] or b"").decode(errors="replace").lower()
+    subtype = (body[1] or b"").decode(errors="replace").lower()
+    if (ctype, subtype) != ("text", "html"):
+        return None
+
+    params = body[2] if isinstance(body[2], list) else []
+    charset = None
+    for i in range(0, len(params) - 1, 2):
+        if params[i] and params[i].lower() == b"charset" and params[i + 1]:
+            charset = params[i + 1].decode(errors="replace")
+    encoding = (body[5] or b"7bit").decode(errors="replace").lower() if len(body) > 5 else "7bit"
+    # Einteilige Mail: der Body ist Teil 1
+    return path or "1", encoding, charset
+
+
+def decode_part(raw: bytes, encoding: str, charset: str | None) -> str:
+    """Dekodiert einen einzeln geholten MIME-Teil (Transfer-Encoding + Charset)."""
+    if encoding == "base64":
+        payload = base64.b64decode(raw)
+    elif encoding == "quoted-printable":
+        payload = quopri.decodestring(raw)
+    else:
+        payload = raw
+    try:
+        return payload.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
+
+
+def fetch_html_streaming(imap: imaplib.IMAP4, uids: list[str]) -> dict[str, email.message.Message]:
+    """
+    Fallback ohne verwertbare BODYSTRUCTURE: holt die Mails blockweise
+    (BODY.PEEK[]<offset.size>, ein FETCH pro Block fuer alle UIDs) in einen
+    BytesFeedParser und hoert pro Mail auf, sobald der HTML-Teil komplett ist.
+    Nachfolgende Anhaenge werden so nicht mehr uebertragen.
+    """
+    parsers = {}
+    created = {}
+    for uid in uids:
+        parts = created[uid] = []
+
+        def factory(*args, _parts=parts, **kwargs):
+            msg = email.message.Message(*args, **kwargs)
+            _parts.append(msg)
+            return msg
+
+        parsers[uid] = email.parser.BytesFeedParser(_factory=factory)
+        # BytesFeedParser ruft die Factory einmal probeweise auf
+        parts.clear()
+
+    results = {}
+    pending = list(uids)
+    offset = 0
+    while pending:
+        data = uid_fetch_many(imap, pending, f"(BODY.PEEK[]<{offset}.{PARTIAL_FETCH_SIZE}>)")
+        still_pending = []
+        for uid in pending:
+            chunk = data.get(uid)
+            if chunk is None:
+                # Kein Literal mehr: Mail endete genau an der Blockgrenze
+                if offset:
+                    results[uid] = parsers[uid].close()
+                continue
+            parser = parsers[uid]
+            parser.feed(chunk)
+            parts = created[uid]
+            html_done = any(
+                p.get_content_type() == "text/html" and i < len(parts) - 1
+                for i, p in enumerate(parts)
+            )
+            if html_done or len(chunk) < PARTIAL_FETCH_SIZE:
+                results[uid] = parser.close() if len(chunk) < PARTIAL_FETCH_SIZE else parts[0]
+            else:
+                still_pending.append(uid)
+        pending = still_pending
+        offset += PARTIAL_FETCH_SIZE
+    return results
+
+
+def fetch_html_bodies(imap: imaplib.IMAP4, uids: list[str]) -> dict[str, tuple[str | None, str]]:
+    """
+    Holt pro Mail nur den text/html-Teil: BODYSTRUCTURE und Subject aller UIDs
+    in einem FETCH, danach ein BODY.PEEK[<part>] je unterschiedlicher Part-Nummer.
+    Liefert {uid: (html oder None, Subject)}; nicht abrufbare UIDs fehlen.
+    """
+    structures = uid_fetch_items(imap, uids, "(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT)])")
+
+    results = {}
+    by_part = {}
+    fallback = []
+    for uid in uids:
+        fetched = structures.get(uid)
+        if fetched is None:
+            continue
+        header = next((v for k, v in fetched.items() if k.startswith(b"BODY[")), b"") or b""
+        subject = decode_header_value(email.message_from_bytes(header).get("Subject", "Keepa Alert"))
+        structure = fetched.get(b"BODYSTRUCTURE")
+        if not isinstance(structure, list):
+            fallback.append(uid)
+            results[uid] = (None, subject)
+            continue
+        part = find_html_part(structure)
+        if part is None:
+            results[uid] = (None, subject)
+            continue
+        by_part.setdefault(part[0], []).append((uid, part, subject))
+
+    for spec, entries in by_part.items():
+        bodies = uid_fetch_many(imap, [uid for uid, _, _ in entries], f"(BODY.PEEK[{spec}])")
+        for uid, (_, encoding, charset), subject in entries:
+            if uid in bodies:
+                results[uid] = (decode_part(bodies[uid], encoding, charset), subject)
+
+    if fallback:
+        log.debug(f"BODYSTRUCTURE nicht verwertbar, Fallback fuer {len(fallback)} Mail(s)")
+        for uid, msg in fetch_html_streaming(imap, fallback).items():
+            results[uid] = (get_html_body(msg), results[uid][1])
+
+    return results
+
+
+# Vorkompilierte Patterns; jedes wird nur an Stellen geprueft, die per str.find
+# ueber ein festes Literal gefunden wurden (deutlich schneller als re.search)
+IMAGE_ANCHOR = 'src="https://m.media-amazon.com/images/'
+IMAGE_RE     = re.compile(r'src="(https://m\.media-amazon\.com/images/[^"]+)"')
+GRAPH_ANCHOR = 'src="https://graph.keepa.com/'
+GRAPH_RE     = re.compile(r'src="(https://graph\.keepa\.com/[^"]+)"')
+LINK_ANCHOR  = 'href="https://dyn'
+LINK_RE      = re.compile(r'href="(https://dyn[^"]*keepa\.com/r/[^"]+)"(?:[^>]*>([^<]+)</a>)?')
+
+# Zeilen aus <tbody> parsen — jede Zeile hat: Typ, Aktuell, Wunsch, Differenz, Ursache
+ROW_RE = re.compile(
+    r'<tr>\s*'
+    r'<td[^>]*>([^<]*)</td>\s*'           # Typ (z.B. "Amazon")
+    r'<td[^>]*>([^<]*)</td>\s*'            # Aktuell
+    r'<td[^>]*>([^<]*)</td>\s*'            # Wunsch
+    r'<td[^>]*>(?:<[^>]*>)*([^<]*)(?:</[^>]*>)*</td>\s*'  # Differenz (ggf. in <span>)
+    r'<td[^>]*>([^<]*)</td>',              # Ursache
+    re.DOTALL,
+)
+
+
+def find_anchored(pattern: re.Pattern, anchor: str, html: str, start: int = 0) -> re.Match | None:
+    """Erster Treffer von `pattern` an einer Fundstelle des Literals `anchor` ab `start`."""
+    pos = html.find(anchor, start)
+    while pos != -1:
+        m = pattern.match(html, pos)
+        if m:
+            return m
+        pos = html.find(anchor, pos + 1)
+    return None
+
+
+def unescape(text: str) -> str:
+    """html.unescape mit schnellem Pfad fuer die in Keepa-Mails ueblichen Entities."""
+    if "&" not in text:
+        return text
+    fast = text.replace("&nbsp;", "\xa0").replace("&euro;", "€")
+    if "&" in fast.replace("&amp;", ""):
+        return html_mod.unescape(text)
+    return fast.replace("&amp;", "&")
+
+
+def parse_keepa_html(html: str) -> KeepaAlert:
+    """
+    Parst die Keepa-Mail und extrahiert die wesentlichen Elemente.
+    Jede Suche endet beim ersten Treffer, die Preistabelle beim ersten </table>.
+    """
+    alert = KeepaAlert()
+
+    # 1. Produktbild (Amazon)
+    m = find_anchored(IMAGE_RE, IMAGE_ANCHOR, html)
     if m:
-        data["amazon_link"] = html_mod.unescape(m.group(1))
+        alert.product_image = unescape(m.group(1))
 
-    # 4. Produktname (Text im Link zum Produkt)
-    m = re.search(
-        r'href="https://dyn[^"]*keepa\.com/r/[^"]*"[^>]*>([^<]+)</a>',
-        html,
-    )
+    # 2. Preisgraph (Keepa)
+    m = find_anchored(GRAPH_RE, GRAPH_ANCHOR, html)
     if m:
-        data["product_name"] = html_mod.unescape(m.group(1)).strip()
+        alert.price_graph = unescape(m.group(1))
+
+    # 3./4. Amazon-Link (Keepa redirect) und Produktname (erster Link mit Text)
+    pos = 0
+    while m := find_anchored(LINK_RE, LINK_ANCHOR, html, pos):
+        if alert.amazon_link is None:
+            alert.amazon_link = unescape(m.group(1))
+        if m.group(2) is not None:
+            alert.product_name = unescape(m.group(2)).strip()
+            break
+        pos = m.end()
 
     # 5. Preistabelle: Aktuell, Wunsch, Differenz
-    # Zeilen aus <tbody> parsen — jede Zeile hat: Typ, Aktuell, Wunsch, Differenz, Ursache
-    row_pattern = re.compile(
-        r'<tr>\s*'
-        r'<td[^>]*>([^<]*)</td>\s*'           # Typ (z.B. "Amazon")
-        r'<td[^>]*>([^<]*)</td>\s*'            # Aktuell
-        r'<td[^>]*>([^<]*)</td>\s*'            # Wunsch
-        r'<td[^>]*>(?:<[^>]*>)*([^<]*)(?:</[^>]*>)*</td>\s*'  # Differenz (ggf. in <span>)
-        r'<td[^>]*>([^<]*)</td>',              # Ursache
-        re.DOTALL,
-    )
-    rows = []
-    for rm in row_pattern.finditer(html):
-        row = {
-            "typ": html_mod.unescape(rm.group(1)).strip(),
-            "aktuell": html_mod.unescape(rm.group(2)).replace("\xa0", " ").strip(),
-            "wunsch": html_mod.unescape(rm.group(3)).replace("\xa0", " ").strip(),
-            "differenz": html_mod.unescape(rm.group(4)).replace("\xa0", " ").strip(),
-        }
-        rows.append(row)
-    if rows:
-        data["price_rows"] = rows
-
-    return data
-
-
-def build_markdown(data: dict, title: str = "") -> str:
-    """Baut den Markdown-Body fuer ntfy aus den extrahierten Daten."""
+    pos = html.find("<tr>")
+    table_end = -1
+    while pos != -1 and (table_end == -1 or pos < table_end):
+        m = ROW_RE.match(html, pos)
+        if not m:
+            pos = html.find("<tr>", pos + 1)
+            continue
+        alert.price_rows.append(PriceRow(
+            typ=unescape(m.group(1)).strip(),
+            aktuell=unescape(m.group(2)).replace("\xa0", " ").strip(),
+            wunsch=unescape(m.group(3)).replace("\xa0", " ").strip(),
+            differenz=unescape(m.group(4)).replace("\xa0", " ").strip(),
+        ))
+        if table_end == -1:
+            table_end = html.find("</table>", m.end())
+        pos = html.find("<tr>", m.end())
+
+    return alert
+
+
+def build_markdown(alert: KeepaAlert, title: str = "", images: bool = True, history: str = "") -> str:
+    """
+    Baut den Markdown-Body fuer ntfy aus den extrahierten Daten (images=False: kompakt
+    fuer Digests). `history` ist eine optionale Zeile aus der Preishistorie.
+    """
     parts = []
 
     # Produktbild
-    if "product_image" in data:
-        parts.append(f"![Produkt]({data['product_image']})")
+    if images and alert.product_image:
+        parts.append(f"![Produkt]({alert.product_image})")
         parts.append("")
 
     # Produktname als Link (Linktext = Titel)
-    if "amazon_link" in data:
-        link_text = title or data.get("product_name", "Ab zu Amazon!")
-        parts.append(f"**[{link_text}]({data['amazon_link']})**")
+    if alert.amazon_link:
+        link_text = title or alert.product_name or "Ab zu Amazon!"
+        parts.append(f"**[{link_text}]({alert.amazon_link})**")
         parts.append("")
 
     # Preisinfo
-    if "price_rows" in data:
-        for row in data["price_rows"]:
-            parts.append(f"- **Aktuell:** {row['aktuell']}")
-            parts.append(f"- **Wunsch:** {row['wunsch']}")
-            parts.append(f"- **Differenz:** {row['differenz']}")
+    if alert.price_rows:
+        for row in alert.price_rows:
+            parts.append(f"- **Aktuell:** {row.aktuell}")
+            parts.append(f"- **Wunsch:** {row.wunsch}")
+            parts.append(f"- **Differenz:** {row.differenz}")
+        if history:
+            parts.append(history)
         parts.append("")
 
     # Preisgraph
-    if "price_graph" in data:
-        parts.append(f"![Preisverlauf]({data['price_graph']})")
-
-    return "\n".join(parts)
+    if images and alert.price_graph:
+        parts.append(f"![Preisverlauf]({alert.price_graph})")
+
+    return "\n".join(parts).strip()
+
+
+ASIN_RE = re.compile(r"asin=([A-Z0-9]{10})", re.IGNORECASE)
+
+
+def alert_key(alert: KeepaAlert, fallback: str) -> str:
+    """Schluessel fuer die Duplikaterkennung: ASIN, sonst Amazon-Link, sonst Produktname."""
+    for url in (alert.amazon_link, alert.price_graph):
+        if url and (m := ASIN_RE.search(url)):
+            return m.group(1).upper()
+    return alert.amazon_link or alert.product_name or fallback
+
+
+def build_digest(jobs: list[dict], uidvalidity: int | None) -> dict:
+    """
+    Fasst Alert-Jobs zu einem Digest-Job zusammen. Mehrfache Alerts fuer dasselbe
+    Produkt (alert_key) zaehlen nur einmal, der neueste gewinnt. Der Body bleibt
+    unter NTFY_MAX_BODY; was nicht passt, wird als "... und N weitere" gezaehlt,
+    ein zu langes erstes Fragment wird gekuerzt.
+    """
+    latest = {}
+    uids = []
+    for job in jobs:
+        latest.pop(job["key"], None)
+        latest[job["key"]] = job
+        # Nach einem UIDVALIDITY-Wechsel zeigen alte UIDs auf andere Mails
+        if job.get("uidvalidity") == uidvalidity:
+            uids += job["uids"]
+    unique = list(latest.values())
+
+    if len(unique) == 1:
+        single = dict(unique[0], uids=uids, uidvalidity=uidvalidity)
+        single.pop("fragment", None)
+        return single
+
+    separator = "\n\n---\n\n"
+    body = ""
+    included = 0
+    for job in unique:
+        rest = len(unique) - included - 1
+        footer = f"{separator}… und {rest} weitere" if rest else ""
+        candidate = body + (separator if body else "") + job["fragment"]
+        if len(candidate) + len(footer) > NTFY_MAX_BODY:
+            if not body:
+                # Schon das erste Fragment passt nicht: gekuerzt statt nur "... und N weitere"
+                body = job["fragment"][:max(NTFY_MAX_BODY - len(footer) - 1, 0)] + "…"
+                included = 1
+            break
+        body = candidate
+        included += 1
+    if included < len(unique):
+        more = f"… und {len(unique) - included} weitere"
+        body = (body + separator + more) if body else more
+
+    return {
+        "uids": uids,
+        "uidvalidity": uidvalidity,
+        "title": f"{len(unique)} Keepa-Preisalarme",
+        "md_body": body,
+        "click_url": None,
+    }
 
 
-def build_title(data: dict, max_len: int = 60) -> str:
+def build_title(alert: KeepaAlert, max_len: int = 60) -> str:
     """Baut einen kompakten Titel: Produktname.. [Aktuell] -> [Wunsch]"""
-    name = data.get("product_name", "Keepa Alert")
+    name = alert.product_name or "Keepa Alert"
     suffix = ""
-    if "price_rows" in data and data["price_rows"]:
-        row = data["price_rows"][0]
+    if alert.price_rows:
+        row = alert.price_rows[0]
         # Preise in deutsches Format: "40.50 €"
-        aktuell = row['aktuell'].replace('€', '').replace('\xa0', '').strip() + ' €'
-        wunsch = row['wunsch'].replace('€', '').replace('\xa0', '').strip() + ' €'
+        aktuell = row.aktuell.replace('€', '').replace('\xa0', '').strip() + ' €'
+        wunsch = row.wunsch.replace('€', '').replace('\xa0', '').strip() + ' €'
         suffix = f" {aktuell} → {wunsch}"
 
     # Produktname kuerzen, sodass Titel + Suffix in max_len passt
@@ -204,23 +778,173 @@ def build_title(data: dict, max_len: int = 60) -> str:
     return f"{name}{suffix}"
 
 
+EMOJI_RE = re.compile(
+    "["
+    "\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF"
+    "\U0001F1E0-\U0001F1FF\U00002702-\U000027BF\U0000FE00-\U0000FE0F"
+    "\U0000200D\U00002640-\U00002642\U00002300-\U000023FF"
+    "\U00010000-\U0001FFFF"
+    "]+",
+    flags=re.UNICODE,
+)
+
+
 def strip_emojis(text: str) -> str:
     """Entfernt Emojis und Unicode-Symbole aus dem Betreff."""
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF"
-        "\U0001F1E0-\U0001F1FF\U00002702-\U000027BF\U0000FE00-\U0000FE0F"
-        "\U0000200D\U00002640-\U00002642\U00002300-\U000023FF"
-        "\U00010000-\U0001FFFF"
-        "]+",
-        flags=re.UNICODE,
+    return EMOJI_RE.sub("", text).strip()
+
+
+# ──────────────────────────────────────────────
+# Preishistorie (SQLite)
+# ──────────────────────────────────────────────
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    product TEXT    NOT NULL,   -- alert_key(): ASIN, sonst Link/Name
+    ts      INTEGER NOT NULL,   -- Unix-Zeit der Verarbeitung
+    alert   TEXT    NOT NULL,   -- UIDVALIDITY:UID, verhindert Doppelungen bei Reprocessing
+    pos     INTEGER NOT NULL,   -- Zeile innerhalb des Alerts (0 = erste, zaehlt den Alert)
+    typ     TEXT    NOT NULL,
+    aktuell INTEGER,            -- Cent
+    wunsch  INTEGER,            -- Cent
+    name    TEXT,
+    UNIQUE (alert, typ)
+);
+-- Alerts zaehlen: reiner Index-Scan ueber (product, ts), ohne DISTINCT
+CREATE INDEX IF NOT EXISTS prices_product_ts ON prices (product, ts, pos);
+-- Tiefstpreis: erster Indexeintrag mit passendem ts, statt alle Zeilen zu lesen
+CREATE INDEX IF NOT EXISTS prices_product_aktuell ON prices (product, aktuell, ts);
+"""
+
+PRICE_NUM_RE = re.compile(r"\d[\d.,]*")
+
+
+def parse_price(text: str) -> int | None:
+    """'1.234,56 €' / '$1,234.56' -> Cent; None wenn kein Preis erkennbar."""
+    m = PRICE_NUM_RE.search(text or "")
+    if not m:
+        return None
+    num = m.group(0).rstrip(".,")
+    # Das letzte Trennzeichen ist Dezimaltrenner, wenn ihm ein oder zwei Ziffern folgen
+    if len(num) > 3 and num[-3] in ",.":
+        whole, cents = num[:-3], num[-2:]
+    elif len(num) > 2 and num[-2] in ",.":
+        whole, cents = num[:-2], num[-1] + "0"
+    else:
+        whole, cents = num, "00"
+    whole = whole.replace(".", "").replace(",", "")
+    return int(whole or "0") * 100 + int(cents)
+
+
+def format_price(cents: int, like: str) -> str:
+    """Formatiert Cent im Stil von `like` (Waehrung, Dezimaltrenner), z.B. '38,90 €'."""
+    m = PRICE_NUM_RE.search(like or "")
+    if not m:
+        return f"{cents / 100:.2f}"
+    sep = "." if len(m.group(0)) > 3 and m.group(0)[-3] == "." else ","
+    return like[:m.start()] + f"{cents // 100}{sep}{cents % 100:02d}" + like[m.end():]
+
+
+def history_open() -> sqlite3.Connection | None:
+    """Oeffnet die Preishistorie (legt Schema an); None wenn deaktiviert oder nicht beschreibbar."""
+    if not HISTORY_DB:
+        return None
+    try:
+        conn = sqlite3.connect(HISTORY_DB)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(HISTORY_SCHEMA)
+        return conn
+    except sqlite3.Error as e:
+        log.warning(f"Preishistorie nicht verfuegbar ({HISTORY_DB}): {e}")
+        return None
+
+
+def history_record(conn: sqlite3.Connection, product: str, alert_id: str, alert: KeepaAlert, ts: int):
+    """Speichert alle Preiszeilen eines Alerts (idempotent pro alert_id + Typ)."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO prices (product, ts, alert, pos, typ, aktuell, wunsch, name) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (product, ts, alert_id, pos, row.typ, parse_price(row.aktuell), parse_price(row.wunsch),
+             alert.product_name)
+            for pos, row in enumerate(alert.price_rows)
+        ],
     )
-    return emoji_pattern.sub("", text).strip()
 
 
-def send_ntfy(title: str, md_body: str, click_url: str | None = None):
-    """Sendet eine Markdown-Notification an ntfy."""
-    url = f"{NTFY_URL.rstrip('/')}/{NTFY_TOPIC}"
+def history_stats(conn: sqlite3.Connection, product: str, since: int) -> tuple[int | None, int]:
+    """Tiefster aktueller Preis und Anzahl Alerts fuer ein Produkt seit `since` (nur Indexzugriffe)."""
+    lowest = conn.execute(
+        "SELECT aktuell FROM prices INDEXED BY prices_product_aktuell "
+        "WHERE product = ? AND aktuell IS NOT NULL AND ts >= ? ORDER BY aktuell LIMIT 1",
+        (product, since),
+    ).fetchone()
+    count, = conn.execute(
+        "SELECT COUNT(*) FROM prices WHERE product = ? AND ts >= ? AND pos = 0",
+        (product, since),
+    ).fetchone()
+    return (lowest[0] if lowest else None), count
+
+
+def history_line(conn: sqlite3.Connection | None, product: str, alert: KeepaAlert, now: int) -> str:
+    """Markdown-Zeile 'Tiefstpreis N Tage' (leer, wenn es noch keine Vergleichswerte gibt)."""
+    if conn is None or not alert.price_rows:
+        return ""
+    lowest, count = history_stats(conn, product, now - HISTORY_DAYS * 86400)
+    if lowest is None or count < 2:
+        return ""
+    price = format_price(lowest, alert.price_rows[0].aktuell)
+    return f"- **Tiefstpreis {HISTORY_DAYS} Tage:** {price} ({count} Alerts)"
+
+
+def print_history(limit: int = 20):
+    """Gibt die Produkte mit den meisten Alerts der letzten HISTORY_DAYS Tage aus (--history)."""
+    conn = history_open()
+    if conn is None:
+        print("Preishistorie deaktiviert (HISTORY_DB leer) oder nicht lesbar.")
+        return
+    since = int(time.time()) - HISTORY_DAYS * 86400
+    with closing(conn):
+        rows = conn.execute(
+            "SELECT product, MAX(name), SUM(pos = 0) AS alerts, MIN(aktuell), MAX(ts) "
+            "FROM prices WHERE ts >= ? GROUP BY product ORDER BY alerts DESC LIMIT ?",
+            (since, limit),
+        ).fetchall()
+    print(f"{'Alerts':>6}  {'Tiefst':>10}  {'Zuletzt':<16}  Produkt")
+    for product, name, count, lowest, last in rows:
+        low = f"{lowest / 100:.2f}" if lowest is not None else "-"
+        last = datetime.fromtimestamp(last).strftime("%Y-%m-%d %H:%M")
+        print(f"{count:>6}  {low:>10}  {last:<16}  {(name or product)[:60]}")
+
+
+_ntfy_local = threading.local()
+_ntfy_executor = None
+
+
+def ntfy_connection() -> http.client.HTTPConnection:
+    """Keep-Alive-Verbindung zu ntfy, eine pro Thread (wird wiederverwendet)."""
+    conn = getattr(_ntfy_local, "conn", None)
+    if conn is None:
+        url = urllib.parse.urlsplit(NTFY_URL)
+        if url.scheme == "https":
+            conn = http.client.HTTPSConnection(url.hostname, url.port, timeout=10,
+                                               context=ssl.create_default_context())
+        else:
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=10)
+        _ntfy_local.conn = conn
+    return conn
+
+
+# Ergebnis von send_ntfy: zugestellt, spaeter erneut versuchen, endgueltig abgelehnt
+SEND_OK, SEND_RETRY, SEND_REJECTED = "ok", "retry", "rejected"
+
+
+def send_ntfy(title: str, md_body: str, click_url: str | None = None) -> str:
+    """
+    Sendet eine Markdown-Notification an ntfy. Liefert SEND_OK, wenn ntfy sie
+    bestaetigt hat, SEND_REJECTED bei 4xx ausser 429 (erneutes Senden aendert
+    daran nichts, z.B. 400/401/413), sonst SEND_RETRY.
+    """
+    path = f"{urllib.parse.urlsplit(NTFY_URL).path.rstrip('/')}/{NTFY_TOPIC}"
     headers = {
         "Title": title.encode("utf-8"),
         "Priority": "high",
@@ -231,70 +955,210 @@ def send_ntfy(title: str, md_body: str, click_url: str | None = None):
     if click_url:
         headers["Click"] = click_url
 
-    body = md_body[:4000].encode("utf-8")
+    body = md_body[:NTFY_MAX_BODY].encode("utf-8")
 
-    req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    # Zweiter Versuch nur, falls ntfy die Keep-Alive-Verbindung inzwischen geschlossen hat
+    for attempt in (1, 2):
+        conn = ntfy_connection()
+        try:
+            conn.request("POST", path, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp_body = resp.read()
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            _ntfy_local.conn = None
+            if attempt == 1 and isinstance(e, (http.client.RemoteDisconnected, BrokenPipeError,
+                                               ConnectionResetError)):
+                continue
+            log.error(f"ntfy Verbindungsfehler: {e}")
+            return SEND_RETRY
 
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
+        if 200 <= resp.status < 300:
             log.info(f"ntfy gesendet (HTTP {resp.status}): {title[:60]}")
-    except urllib.error.HTTPError as e:
-        log.error(f"ntfy HTTP-Fehler {e.code}: {e.read().decode(errors='replace')}")
-    except urllib.error.URLError as e:
-        log.error(f"ntfy Verbindungsfehler: {e.reason}")
-
+            return SEND_OK
+        log.error(f"ntfy HTTP-Fehler {resp.status}: {resp_body.decode(errors='replace')}")
+        if 400 <= resp.status < 500 and resp.status != 429:
+            return SEND_REJECTED
+        return SEND_RETRY
+    return SEND_RETRY
+
+
+def deliver_notifications(jobs: list[dict]) -> tuple[list[dict], list[dict], list[dict]]:
+    """
+    Sendet Notification-Jobs parallel ueber einen dauerhaften Worker-Pool.
+    Ein Job ist {"uids", "title", "md_body", "click_url"}.
+    Liefert (zugestellt, fehlgeschlagen, abgelehnt), jeweils in Eingabereihenfolge.
+    """
+    global _ntfy_executor
+    if not jobs:
+        return [], [], []
+    if _ntfy_executor is None:
+        _ntfy_executor = ThreadPoolExecutor(max_workers=max(NTFY_WORKERS, 1),
+                                            thread_name_prefix="ntfy")
+
+    results = _ntfy_executor.map(
+        lambda job: send_ntfy(job["title"], job["md_body"], job.get("click_url")),
+        jobs,
+    )
+    delivered, failed, rejected = [], [], []
+    for job, result in zip(jobs, results):
+        {SEND_OK: delivered, SEND_RETRY: failed, SEND_REJECTED: rejected}[result].append(job)
+    return delivered, failed, rejected
 
-def poll_keepa_mails():
-    """Hauptlogik: IMAP verbinden, Keepa-Mails suchen, an ntfy senden."""
-    processed = load_processed_uids()
-    new_processed = set()
 
+def imap_connect() -> tuple[imaplib.IMAP4, int | None]:
+    """Verbindet, loggt ein und waehlt INBOX. Liefert (imap, UIDVALIDITY)."""
     log.info(f"Verbinde zu IMAP {IMAP_HOST}:{IMAP_PORT} ...")
 
     # Proxy ist lokal im VLAN, kein SSL noetig
-    try:
-        imap = imaplib.IMAP4(IMAP_HOST, IMAP_PORT)
-    except Exception as e:
-        log.error(f"IMAP-Verbindung fehlgeschlagen: {e}")
-        sys.exit(1)
-
+    imap = imaplib.IMAP4(IMAP_HOST, IMAP_PORT, timeout=IMAP_TIMEOUT)
     try:
         imap.login(IMAP_USER, IMAP_PASS)
         log.info("IMAP Login erfolgreich")
-    except imaplib.IMAP4.error as e:
-        log.error(f"IMAP Login fehlgeschlagen: {e}")
-        imap.logout()
-        sys.exit(1)
-
-    try:
         imap.select("INBOX", readonly=False)
+    except BaseException:
+        imap.logout()
+        raise
+    return imap, get_uidvalidity(imap)
 
-        # Suche nach ungelesenen Mails
-        status, data = imap.uid("SEARCH", None, "UNSEEN")
-        if status != "OK":
-            log.warning(f"IMAP SEARCH fehlgeschlagen: {status}")
-            return
-
-        uids = data[0].split() if data[0] else []
-        log.info(f"{len(uids)} ungelesene Mail(s) gefunden")
-
-        keepa_count = 0
 
-        for uid_bytes in uids:
-            uid = uid_bytes.decode()
+def imap_disconnect(imap: imaplib.IMAP4):
+    """Schliesst Mailbox und Verbindung, Fehler beim Abbau werden ignoriert."""
+    try:
+        imap.close()
+        imap.logout()
+    except (OSError, imaplib.IMAP4.error):
+        pass
 
-            # Skip bereits verarbeitete
-            if uid in processed:
-                continue
 
-            # Mail-Header holen (effizient, nicht ganzer Body)
-            status, header_data = imap.uid("FETCH", uid, "(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)])")
-            if status != "OK":
+def imap_buffered(imap: imaplib.IMAP4) -> bool:
+    """
+    True, wenn imaplib schon Daten vom Socket gelesen, aber noch nicht ausgewertet
+    hat (z.B. '* 3 EXISTS' im selben Segment wie '+ idling'); select() sieht die nicht.
+    peek() auf dem nicht-blockierenden Socket liefert den Puffer, ohne zu warten.
+    """
+    imap.sock.settimeout(0.0)
+    try:
+        return bool(imap.file.peek(1))
+    finally:
+        imap.sock.settimeout(IMAP_TIMEOUT)
+
+
+def imap_idle(imap: imaplib.IMAP4, timeout: int) -> bool:
+    """
+    Wartet per IMAP IDLE (RFC 2177) auf Aenderungen in der Mailbox.
+    Liefert True, sobald der Server neue Mails (EXISTS) meldet,
+    False nach `timeout` Sekunden ohne neue Mail.
+    """
+    tag = imap._new_tag()
+    imap.send(tag + b" IDLE\r\n")
+    got_mail = False
+    # Vor dem "+" darf der Server Untagged-Zeilen schicken (z.B. "* 3 EXISTS");
+    # abgelehnt ist IDLE erst mit einer Tagged-Antwort NO/BAD
+    while True:
+        line = imap.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("Verbindung vor IDLE geschlossen")
+        if line.startswith(b"+"):
+            break
+        if line.startswith(tag):
+            imap.tagged_commands.pop(tag, None)
+            if line[len(tag):].lstrip().startswith(b"OK"):
+                return got_mail
+            raise imaplib.IMAP4.error(f"IDLE abgelehnt: {line.strip()!r}")
+        log.debug(f"IDLE: {line.strip()!r}")
+        if line.startswith(b"*") and line.rstrip().endswith(b"EXISTS"):
+            got_mail = True
+
+    deadline = time.monotonic() + timeout
+    while not got_mail:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # Nur warten, wenn nichts mehr gepuffert ist. Kein settimeout()+readline()
+        # fuer das Warten: nach einem Timeout ist das Socket-File unbrauchbar.
+        if not imap_buffered(imap):
+            readable, _, _ = select.select([imap.sock], [], [], remaining)
+            if not readable:
+                break
+        line = imap.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("Verbindung waehrend IDLE geschlossen")
+        log.debug(f"IDLE: {line.strip()!r}")
+        if line.startswith(b"*") and line.rstrip().endswith(b"EXISTS"):
+            got_mail = True
+
+    imap.send(b"DONE\r\n")
+    # Restliche Untagged-Zeilen bis zur Tagged-Antwort auf IDLE lesen
+    while True:
+        line = imap.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("Verbindung nach IDLE geschlossen")
+        if line.startswith(tag):
+            break
+        if line.startswith(b"*") and line.rstrip().endswith(b"EXISTS"):
+            got_mail = True
+    imap.tagged_commands.pop(tag, None)
+    if not line[len(tag):].lstrip().startswith(b"OK"):
+        raise imaplib.IMAP4.error(f"IDLE fehlgeschlagen: {line.strip()!r}")
+    return got_mail
+
+
+def imap_wait_noop(imap: imaplib.IMAP4, interval: int) -> bool:
+    """Fallback ohne IDLE: wartet `interval` Sekunden und fragt per NOOP nach neuen Mails."""
+    time.sleep(interval)
+    imap.noop()
+    _, data = imap.response("EXISTS")
+    return bool(data and data[0] is not None)
+
+
+def process_mailbox(imap: imaplib.IMAP4, uidvalidity: int | None, state: dict):
+    """Sucht neue Keepa-Mails in der gewaehlten Mailbox, sendet sie an ntfy und aktualisiert `state`."""
+    # Neue UIDVALIDITY: alte UIDs sind ungueltig, kompletter Neustart
+    if state["uidvalidity"] is not None and uidvalidity != state["uidvalidity"]:
+        log.warning(f"UIDVALIDITY geaendert ({state['uidvalidity']} -> {uidvalidity}), State zurueckgesetzt")
+        state["last_uid"] = 0
+    state["uidvalidity"] = uidvalidity
+
+    # Nur UIDs oberhalb der zuletzt verarbeiteten durchsuchen
+    min_uid = state["last_uid"] + 1
+
+    failed_uids = []
+    if SERVER_SIDE_FILTER:
+        # Nur Keepa-Mails verlassen den Server, Header-FETCH entfaellt.
+        # Die ungefilterte Suche zuerst: ihr Maximum ist der Horizont, bis zu dem
+        # last_uid vorruecken darf. Keepa-Mails, die erst zwischen beiden Suchen
+        # ankommen, liegen darueber und bleiben fuer den naechsten Lauf liegen.
+        candidates = uid_search(imap, build_search_criteria(False, min_uid), min_uid)
+        if candidates is None:
+            return
+        horizon = max((int(uid) for uid in candidates), default=0)
+        keepa_uids = uid_search(imap, build_search_criteria(True, min_uid), min_uid) if candidates else []
+        if keepa_uids is None:
+            return
+        keepa_uids = [uid for uid in keepa_uids if int(uid) <= horizon]
+        log.info(
+            f"{len(keepa_uids)} neue ungelesene Keepa-Mail(s) gefunden, "
+            f"{len(candidates) - len(keepa_uids)} andere serverseitig uebersprungen"
+        )
+    else:
+        candidates = uid_search(imap, build_search_criteria(False, min_uid), min_uid)
+        if candidates is None:
+            return
+        log.info(f"{len(candidates)} neue ungelesene Mail(s) gefunden")
+
+        # Header aller Kandidaten in einem Rutsch holen (nicht ganzer Body)
+        headers = uid_fetch_many(imap, candidates, "(BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)])")
+
+        keepa_uids = []
+        for uid in candidates:
+            raw_header = headers.get(uid)
+            if raw_header is None:
+                # Ohne Header keine Entscheidung: last_uid nicht darueber hinaus vorruecken
+                log.warning(f"Kein Header fuer UID {uid}, wird im naechsten Lauf erneut geprueft")
+                failed_uids.append(int(uid))
                 continue
-
-            raw_header = header_data[0][1]
             header_msg = email.message_from_bytes(raw_header)
-
             from_addr = parseaddr(header_msg.get("From", ""))[1].lower()
 
             # Nur Keepa-Mails verarbeiten
@@ -302,54 +1166,205 @@ def poll_keepa_mails():
                 continue
 
             log.debug(f"Keepa-Mail gefunden: UID {uid}, From: {from_addr}")
+            keepa_uids.append(uid)
 
-            # Jetzt ganzen Body holen
-            status, msg_data = imap.uid("FETCH", uid, "(RFC822)")
-            if status != "OK":
-                continue
+        log.info(f"{len(candidates) - len(keepa_uids)} Nicht-Keepa-Mail(s) clientseitig verworfen")
 
-            msg = email.message_from_bytes(msg_data[0][1])
+    jobs = []
+    if keepa_uids:
+        # Nur die HTML-Teile aller Keepa-Mails holen (PEEK: \Seen erst nach Zustellung)
+        bodies = fetch_html_bodies(imap, keepa_uids)
+        history = history_open()
+        now = int(time.time())
 
-            # HTML parsen und Markdown aufbauen
-            html_body = get_html_body(msg)
+        for uid in keepa_uids:
+            if uid not in bodies:
+                failed_uids.append(int(uid))
+                continue
+            html_body, subject = bodies[uid]
+
+            # HTML parsen, Preise in die Historie schreiben und Markdown aufbauen
             if html_body:
-                data = parse_keepa_html(html_body)
-                title = build_title(data)
-                md_body = build_markdown(data, title=title)
+                alert = parse_keepa_html(html_body)
+                title = build_title(alert)
+                product = alert_key(alert, fallback=f"uid:{uid}")
+                extra = ""
+                if history is not None:
+                    history_record(history, product, f"{uidvalidity}:{uid}", alert, now)
+                    extra = history_line(history, product, alert, now)
+                md_body = build_markdown(alert, title=title, history=extra)
             else:
                 md_body = "(Kein HTML-Inhalt)"
-                data = {}
-                title = decode_header_value(msg.get("Subject", "Keepa Alert"))
-
-            log.debug(f"Extrahiert: {list(data.keys())}")
+                alert = KeepaAlert()
+                title = subject
+                product = f"uid:{uid}"
+                extra = ""
+
+            log.debug(f"Extrahiert: {alert.found_fields()}")
+
+            job = {
+                "uids": [uid],
+                "uidvalidity": uidvalidity,
+                "title": title,
+                "md_body": md_body,
+                "click_url": alert.amazon_link,
+            }
+            if DIGEST_MODE:
+                job["key"] = product
+                job["fragment"] = build_markdown(alert, title=title, images=False, history=extra) if html_body else title
+                job["collected"] = time.time()
+            jobs.append(job)
+
+        if history is not None:
+            history.commit()
+            history.close()
+
+    if DIGEST_MODE:
+        # Alerts sammeln, bis das Zeitfenster abgelaufen ist, dann ein Digest
+        pending = load_digest_pending() + jobs
+        due_in = digest_due_in(pending)
+        if due_in is not None and due_in <= 0:
+            jobs = [build_digest(pending, uidvalidity)]
+            log.info(f"Digest aus {len(pending)} Alert(s): {jobs[0]['title']}")
+            pending = []
+        else:
+            jobs = []
+            if pending:
+                log.info(f"{len(pending)} Alert(s) fuer den Digest gesammelt, faellig in {due_in:.0f}s")
+        save_digest_pending(pending)
+
+    # Retry-Queue aus frueheren Laeufen zuerst, dann neue Alerts -- alles parallel an ntfy
+    retry_jobs = load_retry_queue()
+    if retry_jobs:
+        log.info(f"{len(retry_jobs)} Notification(s) aus der Retry-Queue werden erneut gesendet")
+    delivered, failed, rejected = deliver_notifications(retry_jobs + jobs)
+
+    # Nur von ntfy bestaetigte Mails mit einem STORE als gelesen markieren
+    seen_uids = [
+        uid
+        for job in delivered
+        if job.get("uidvalidity") == uidvalidity
+        for uid in job["uids"]
+    ]
+    uid_mark_seen(imap, seen_uids)
+
+    for job in failed:
+        job["attempts"] = job.get("attempts", 0) + 1
+        job.setdefault("queued", datetime.now().isoformat())
+    # Endgueltig abgelehnte und zu oft fehlgeschlagene Jobs verwerfen, statt sie ewig
+    # mitzuschleppen; ihre Mails bleiben ungelesen im Postfach
+    expired = [job for job in failed if job["attempts"] >= RETRY_MAX_ATTEMPTS]
+    failed = [job for job in failed if job["attempts"] < RETRY_MAX_ATTEMPTS]
+    for job in rejected:
+        log.error(f"Notification von ntfy abgelehnt, verworfen (UIDs {', '.join(job['uids'])}): {job['title'][:60]}")
+    for job in expired:
+        log.error(f"Notification nach {job['attempts']} Versuchen verworfen "
+                  f"(UIDs {', '.join(job['uids'])}): {job['title'][:60]}")
+    if failed:
+        log.warning(f"{len(failed)} Notification(s) nicht zugestellt, bleiben in der Retry-Queue")
+    if retry_jobs or failed or expired:
+        save_retry_queue(failed)
+
+    delivered_ids = {id(job) for job in delivered}
+    new_delivered = sum(len(job["uids"]) for job in jobs if id(job) in delivered_ids)
+    if DIGEST_MODE:
+        log.info(f"{new_delivered} Keepa-Mail(s) per Digest zugestellt, {len(pending)} Alert(s) gesammelt")
+    else:
+        log.info(f"{new_delivered} von {len(keepa_uids)} Keepa-Mail(s) zugestellt")
+
+    # Hoechste abgearbeitete UID merken (nicht zugestellte liegen in der Retry-Queue);
+    # nicht abrufbare Mails beim naechsten Lauf erneut versuchen
+    if candidates:
+        new_last = max(int(uid) for uid in candidates)
+        if failed_uids:
+            new_last = min(new_last, min(failed_uids) - 1)
+        state["last_uid"] = max(state["last_uid"], new_last)
 
-            # An ntfy senden
-            send_ntfy(
-                title=title,
-                md_body=md_body,
-                click_url=data.get("amazon_link"),
-            )
 
-            # Mail als gelesen markieren
-            imap.uid("STORE", uid, "+FLAGS", "\\Seen")
-            new_processed.add(uid)
-            keepa_count += 1
+def poll_keepa_mails():
+    """Hauptlogik (Einzellauf): IMAP verbinden, Keepa-Mails suchen, an ntfy senden."""
+    state = load_state()
+    old_state = dict(state)
 
-        log.info(f"{keepa_count} Keepa-Mail(s) verarbeitet")
+    try:
+        imap, uidvalidity = imap_connect()
+    except imaplib.IMAP4.error as e:
+        log.error(f"IMAP Login fehlgeschlagen: {e}")
+        sys.exit(1)
+    except Exception as e:
+        log.error(f"IMAP-Verbindung fehlgeschlagen: {e}")
+        sys.exit(1)
 
+    try:
+        process_mailbox(imap, uidvalidity, state)
     finally:
-        imap.close()
-        imap.logout()
+        imap_disconnect(imap)
+        if state != old_state:
+            save_state(state)
 
-    # State aktualisieren (alte UIDs behalten, neue hinzufuegen)
-    # Maximal die letzten 500 UIDs behalten, um das File nicht wachsen zu lassen
-    all_uids = processed | new_processed
-    if len(all_uids) > 500:
-        all_uids = set(sorted(all_uids, key=int, reverse=True)[:500])
-    save_processed_uids(all_uids)
+
+def run_daemon():
+    """
+    Daemon-Modus: haelt eine IMAP-Verbindung offen und verarbeitet neue Mails,
+    sobald der Server sie per IDLE meldet (ohne IDLE: NOOP-Polling).
+    Bei Verbindungsfehlern wird mit exponentiellem Backoff neu verbunden.
+    """
+    state = load_state()
+    backoff = 5
+
+    while True:
+        try:
+            imap, uidvalidity = imap_connect()
+        except (OSError, imaplib.IMAP4.error) as e:
+            log.error(f"IMAP-Verbindung fehlgeschlagen: {e} — neuer Versuch in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, DAEMON_MAX_BACKOFF)
+            continue
+
+        backoff = 5
+        use_idle = "IDLE" in imap.capabilities
+        log.info("Warte auf neue Mails per " + ("IDLE" if use_idle else f"NOOP alle {DAEMON_POLL_INTERVAL}s"))
+
+        try:
+            has_new = True
+            while True:
+                due_in = digest_due_in(load_digest_pending()) if DIGEST_MODE else None
+                if has_new or RETRY_FILE.exists() or (due_in is not None and due_in <= 0):
+                    old_state = dict(state)
+                    process_mailbox(imap, uidvalidity, state)
+                    if state != old_state:
+                        save_state(state)
+                    due_in = digest_due_in(load_digest_pending()) if DIGEST_MODE else None
+
+                # Ein gesammelter Digest verkuerzt die Wartezeit bis zu seiner Faelligkeit
+                wait = IDLE_TIMEOUT if use_idle else DAEMON_POLL_INTERVAL
+                if due_in is not None:
+                    wait = max(1, min(wait, int(due_in) + 1))
+                if use_idle:
+                    has_new = imap_idle(imap, wait)
+                else:
+                    has_new = imap_wait_noop(imap, wait)
+        except (OSError, imaplib.IMAP4.error) as e:
+            log.warning(f"IMAP-Verbindung verloren: {e} — verbinde neu")
+        finally:
+            imap_disconnect(imap)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keepa-Preisalarme per IMAP an ntfy weiterleiten")
+    parser.add_argument("--daemon", action="store_true",
+                        help="dauerhaft laufen und per IMAP IDLE auf neue Mails warten")
+    parser.add_argument("--history", action="store_true",
+                        help=f"Produkte mit den meisten Alerts der letzten {HISTORY_DAYS} Tage ausgeben")
+    args = parser.parse_args()
+
+    if args.history:
+        print_history()
+        sys.exit(0)
+
     log.info("=== keepa-ntfy-poll gestartet ===")
-    poll_keepa_mails()
+    if args.daemon:
+        run_daemon()
+    else:
+        poll_keepa_mails()
     log.info("=== keepa-ntfy-poll beendet ===")
@@ -17,15 +17,50 @@ Direkter Aufruf:
 
 2. Rechteck-SVG erzeugen:
    python main.py --rect --width 61.8 --height 61.8 --radius 15
+
+3. Batch: mehrere CSV-Dateien mit einer oder mehreren Schriftarten, parallel:
+   python main.py --batch --csv csv/*-Gewürze.csv --font Sniglet-Regular.ttf "PlaypenSans-Medium (Polish).ttf" --jobs 8
+
+Mit --compact (bei --text und --batch) wird jede Glyphe nur einmal in <defs>
+abgelegt und per <use> platziert, Pfade kompakt kodiert und auf --precision
+Nachkommastellen gerundet (Standard: 1).
+
+Der Text wird mit Kerning (GPOS bzw. 'kern'-Tabelle), Standard-Ligaturen und
+Markenankern gesetzt; Zeichen, die der Schriftart fehlen, werden nach Möglichkeit
+aus ihrer Unicode-Zerlegung zusammengesetzt. --no-shaping setzt wie früher nur
+nach den Vorschubbreiten.
+
+Batch-Läufe schreiben nur SVGs neu, deren Text, Schriftart-Datei oder Optionen
+sich geändert haben (Manifest .manifest.json im Ausgabeordner), und löschen SVGs
+zu Texten, die nicht mehr in der CSV stehen. --force erzeugt alles neu.
 """
 
 import argparse
+import hashlib
+import json
 import os
+import sys
+import time
+import unicodedata
 import svgwrite
 import csv
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from fontTools.ttLib import TTFont
+from fontTools.pens.basePen import BasePen
 from fontTools.pens.svgPathPen import SVGPathPen
 
+# Obergrenzen der Caches: Schriftarten pro Prozess, Glyphen-Pfade über alle Schriftarten
+FONT_CACHE_SIZE = 8
+GLYPH_CACHE_SIZE = 4096
+
+# Manifest im Ausgabeordner: welche SVG mit welchem Schlüssel erzeugt wurde
+MANIFEST_NAME = ".manifest.json"
+# Erhöhen, wenn sich das erzeugte SVG bei gleicher Eingabe ändert (Layout, Pfad-Kodierung)
+RENDER_VERSION = 1
+
 def get_font_path(font_name: str) -> str:
     script_dir = os.path.dirname(os.path.abspath(__file__))
     font_dir = os.path.join(script_dir, "fonts")
@@ -44,33 +79,389 @@ def list_fonts() -> list:
     font_dir = os.path.join(script_dir, "fonts")
     return [f for f in os.listdir(font_dir) if f.endswith(".ttf")]
 
-def text_to_svg(font_name: str, text: str, output_svg: str) -> None:
-    font_path = get_font_path(font_name)
-    font = TTFont(font_path)
-    glyph_set = font.getGlyphSet()
-    cmap = font["cmap"].getBestCmap()
-    hmtx = font["hmtx"].metrics
-    ascent = font["hhea"].ascent
-    descent = font["hhea"].descent
+def feature_lookups(table, tag: str) -> list:
+    """Lookup-Indizes aller Features `tag` einer GSUB/GPOS-Tabelle, in Lookup-Reihenfolge."""
+    if table is None or not table.FeatureList:
+        return []
+    indices = {i for record in table.FeatureList.FeatureRecord if record.FeatureTag == tag
+               for i in record.Feature.LookupListIndex}
+    return [table.LookupList.Lookup[i] for i in sorted(indices)]
+
+def lookup_subtables(lookup) -> list:
+    """(Typ, Subtabelle) eines Lookups, Extension-Lookups (GSUB 7, GPOS 9) ausgepackt."""
+    return [(subtable.ExtensionLookupType, subtable.ExtSubTable) if lookup.LookupType in (7, 9)
+            and hasattr(subtable, "ExtSubTable") else (lookup.LookupType, subtable)
+            for subtable in lookup.SubTable]
+
+class Kerning:
+    """
+    Paar-Kerning einer Schriftart als Dict (linke, rechte Glyphe) -> Wert.
+    Die alte 'kern'-Tabelle steht komplett vorberechnet in `pairs`. GPOS-Paare
+    werden beim ersten Auftreten aus den Lookups aufgelöst und ebenfalls in
+    `pairs` abgelegt: ausmultipliziert wären das bei manchen Schriftarten
+    Hunderttausende Einträge, von denen ein Label nur eine Handvoll braucht, und
+    alle Paare zu dekodieren kostet mehr als ein ganzer CSV-Lauf. Im Layout
+    ist Kerning damit ein Dict-Zugriff pro Glyphenpaar.
+    """
+    def __init__(self, pairs: dict = None, lookups: list = ()):
+        self.pairs = dict(pairs or {})
+        self.lookups = lookups  # pro Lookup: Liste von ("pairs", ...) / ("classes", ...)
+
+    @classmethod
+    def from_font(cls, font: TTFont) -> "Kerning":
+        gpos = font["GPOS"].table if "GPOS" in font else None
+        lookups = []
+        for lookup in feature_lookups(gpos, "kern"):
+            subtables = []
+            for lookup_type, subtable in lookup_subtables(lookup):
+                if lookup_type != 2:
+                    continue  # nur Paar-Kerning, kontextabhängiges Kerning wird ignoriert
+                if subtable.Format == 1:
+                    # PairSets bzw. Klassenzeilen werden erst bei Bedarf dekodiert (_lookup)
+                    subtables.append(("pairs", {glyph: i for i, glyph in enumerate(subtable.Coverage.glyphs)},
+                                      subtable.PairSet, {}))
+                elif subtable.Format == 2:
+                    subtables.append(("classes", set(subtable.Coverage.glyphs), subtable.ClassDef1.classDefs,
+                                      subtable.ClassDef2.classDefs, subtable.Class1Record, {}))
+            lookups.append(subtables)
+        if lookups:
+            return cls(lookups=lookups)
+        # Ohne GPOS-Kerning: alte 'kern'-Tabelle, spätere Subtabellen überschreiben nicht
+        pairs = {}
+        if "kern" in font:
+            for table in font["kern"].kernTables:
+                for pair, value in getattr(table, "kernTable", {}).items():
+                    pairs.setdefault(pair, value)
+        return cls(pairs)
+
+    def pair(self, left: str, right: str) -> int:
+        """Kerning zwischen zwei Glyphen (Font-Einheiten), summiert über alle Lookups."""
+        value = self.pairs.get((left, right))
+        if value is None:
+            value = sum(self._lookup(subtables, left, right) for subtables in self.lookups)
+            self.pairs[(left, right)] = value
+        return value
+
+    @staticmethod
+    def _lookup(subtables: list, left: str, right: str) -> int:
+        # Innerhalb eines Lookups gilt die erste Subtabelle, die das Paar abdeckt
+        for subtable in subtables:
+            if subtable[0] == "pairs":
+                _, coverage, pair_sets, rows = subtable
+                if left not in coverage:
+                    continue
+                row = rows.get(left)
+                if row is None:
+                    row = rows[left] = {record.SecondGlyph: getattr(record.Value1, "XAdvance", 0) or 0
+                                        for record in pair_sets[coverage[left]].PairValueRecord}
+                if right in row:
+                    return row[right]
+            elif left in subtable[1]:
+                _, _, class1, class2, records, rows = subtable
+                left_class = class1.get(left, 0)
+                row = rows.get(left_class)
+                if row is None:
+                    row = rows[left_class] = [getattr(record.Value1, "XAdvance", 0) or 0
+                                              for record in records[left_class].Class2Record]
+                return row[class2.get(right, 0)]
+        return 0
+
+@dataclass(frozen=True)
+class LoadedFont:
+    """Einmal geparste Schriftart mit den Tabellen, die text_to_svg braucht."""
+    glyph_set: object
+    cmap: dict
+    hmtx: dict
+    ascent: int
+    descent: int
+    kerning: Kerning
+    ligatures: dict       # erste Glyphe -> [(weitere Glyphen, Ligatur)], GSUB 'liga'
+    mark_glyphs: frozenset
+    mark_anchors: dict    # Mark -> [(Subtabelle, Klasse, x, y)], GPOS 'mark'
+    base_anchors: list    # pro Subtabelle: (Basis -> Index, BaseRecords), siehe base_anchor
+
+def read_ligatures(font: TTFont) -> dict:
+    ligatures = {}
+    gsub = font["GSUB"].table if "GSUB" in font else None
+    for lookup in feature_lookups(gsub, "liga"):
+        for lookup_type, subtable in lookup_subtables(lookup):
+            if lookup_type == 4:
+                for first, entries in subtable.ligatures.items():
+                    ligatures.setdefault(first, []).extend(
+                        (tuple(entry.Component), entry.LigGlyph) for entry in entries)
+    return ligatures
+
+def read_mark_anchors(font: TTFont) -> tuple:
+    """
+    Ankerpunkte aus GPOS 'mark' (MarkBasePos): (Marks, Basen). Die BaseRecords
+    bleiben undekodiert, bis eine Basis tatsächlich eine Mark trägt.
+    """
+    marks, bases = {}, []
+    gpos = font["GPOS"].table if "GPOS" in font else None
+    subtables = [subtable for lookup in feature_lookups(gpos, "mark")
+                 for lookup_type, subtable in lookup_subtables(lookup) if lookup_type == 4]
+    # Markenklassen gelten nur innerhalb ihrer Subtabelle, daher (Subtabelle, Klasse)
+    for key, subtable in enumerate(subtables):
+        for glyph, record in zip(subtable.MarkCoverage.glyphs, subtable.MarkArray.MarkRecord):
+            marks.setdefault(glyph, []).append(
+                (key, record.Class, record.MarkAnchor.XCoordinate, record.MarkAnchor.YCoordinate))
+        bases.append(({glyph: i for i, glyph in enumerate(subtable.BaseCoverage.glyphs)},
+                      subtable.BaseArray.BaseRecord))
+    return marks, bases
+
+def base_anchor(font: "LoadedFont", base: str, key: int, mark_class: int):
+    coverage, records = font.base_anchors[key]
+    index = coverage.get(base)
+    anchor = records[index].BaseAnchor[mark_class] if index is not None else None
+    return None if anchor is None else (anchor.XCoordinate, anchor.YCoordinate)
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font_name: str) -> LoadedFont:
+    """
+    Lädt eine Schriftart aus dem 'fonts'-Ordner. Jede Schriftart wird pro
+    Prozess nur einmal geparst, weitere Aufrufe kommen aus dem Cache. lazy=True:
+    von GSUB/GPOS werden nur die Lookups dekodiert, die hier gelesen werden.
+    """
+    font = TTFont(get_font_path(font_name), lazy=True)
+    mark_anchors, base_anchors = read_mark_anchors(font)
+    mark_glyphs = set(mark_anchors)
+    if "GDEF" in font and font["GDEF"].table.GlyphClassDef:
+        mark_glyphs.update(glyph for glyph, glyph_class in font["GDEF"].table.GlyphClassDef.classDefs.items()
+                           if glyph_class == 3)
+    return LoadedFont(
+        glyph_set=font.getGlyphSet(),
+        cmap=font["cmap"].getBestCmap(),
+        hmtx=font["hmtx"].metrics,
+        ascent=font["hhea"].ascent,
+        descent=font["hhea"].descent,
+        kerning=Kerning.from_font(font),
+        ligatures=read_ligatures(font),
+        mark_glyphs=frozenset(mark_glyphs),
+        mark_anchors=mark_anchors,
+        base_anchors=base_anchors,
+    )
+
+def format_number(value: float, precision: int) -> str:
+    """Kürzeste Schreibweise einer Zahl mit max. `precision` Nachkommastellen ("0.5" -> ".5")."""
+    text = f"{value:.{precision}f}"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    if text.startswith("0."):
+        text = text[1:]
+    elif text.startswith("-0."):
+        text = "-" + text[2:]
+    return "0" if text == "-0" else text
+
+class CompactPathPen(BasePen):
+    """
+    Pen für kurze Pfad-Strings: relative Koordinaten, auf `precision`
+    Nachkommastellen gerundet, h/v für waagrechte/senkrechte Linien, t für
+    Kurven, deren Kontrollpunkt der gespiegelte vorherige ist (bei TrueType
+    die Regel), wiederholte Befehle und unnötige Trennzeichen entfallen.
+    Relativ wird immer zu gerundeten Punkten gerechnet, Rundungsfehler
+    summieren sich daher nicht auf.
+    """
+    def __init__(self, glyph_set, precision: int = 1):
+        super().__init__(glyph_set)
+        self.precision = precision
+        self.parts = []
+        self.last_command = None
+        self.last_number = ""
+        self.pos = (0, 0)
+        self.start = (0, 0)
+        self.last_control = None
+
+    def _round(self, pt) -> tuple:
+        return round(pt[0], self.precision), round(pt[1], self.precision)
+
+    def _emit(self, command: str, *coords) -> None:
+        if command != self.last_command or command in "mz":
+            self.parts.append(command)
+            self.last_number = ""
+        for value in coords:
+            number = format_number(value, self.precision)
+            # Trennzeichen nur, wo die Zahl sonst mit der vorherigen verschmelzen würde
+            if self.last_number and not number.startswith("-") and not (number.startswith(".") and "." in self.last_number):
+                self.parts.append(" ")
+            self.parts.append(number)
+            self.last_number = number
+        self.last_command = command
+
+    def _relative(self, pt) -> tuple:
+        return pt[0] - self.pos[0], pt[1] - self.pos[1]
+
+    def _moveTo(self, pt):
+        pt = self._round(pt)
+        self._emit("m", *self._relative(pt))
+        self.pos = self.start = pt
+        self.last_control = None
+
+    def _lineTo(self, pt):
+        pt = self._round(pt)
+        dx, dy = self._relative(pt)
+        if dy == 0:
+            self._emit("h", dx)
+        elif dx == 0:
+            self._emit("v", dy)
+        else:
+            self._emit("l", dx, dy)
+        self.pos = pt
+        self.last_control = None
+
+    def _qCurveToOne(self, pt1, pt2):
+        pt1, pt2 = self._round(pt1), self._round(pt2)
+        if self.last_control is not None and self._round(
+                (2 * self.pos[0] - self.last_control[0], 2 * self.pos[1] - self.last_control[1])) == pt1:
+            self._emit("t", *self._relative(pt2))
+        else:
+            self._emit("q", *self._relative(pt1), *self._relative(pt2))
+        self.pos = pt2
+        self.last_control = pt1
 
+    def _curveToOne(self, pt1, pt2, pt3):
+        pt1, pt2, pt3 = self._round(pt1), self._round(pt2), self._round(pt3)
+        self._emit("c", *self._relative(pt1), *self._relative(pt2), *self._relative(pt3))
+        self.pos = pt3
+        self.last_control = None
+
+    def _closePath(self):
+        self._emit("z")
+        self.pos = self.start
+        self.last_control = None
+
+    def getCommands(self) -> str:
+        return "".join(self.parts)
+
+@lru_cache(maxsize=GLYPH_CACHE_SIZE)
+def glyph_outline(font_name: str, glyph_name: str, precision: int = None) -> tuple:
+    """
+    Pfad-String und Vorschubbreite einer Glyphe; jede Glyphe wird nur einmal gezeichnet.
+    Ohne `precision` wie SVGPathPen, sonst kompakt kodiert (CompactPathPen).
+    """
+    font = load_font(font_name)
+    pen = SVGPathPen(font.glyph_set) if precision is None else CompactPathPen(font.glyph_set, precision)
+    font.glyph_set[glyph_name].draw(pen)
+    return pen.getCommands(), font.hmtx[glyph_name][0]
+
+def map_glyphs(font: LoadedFont, text: str) -> tuple:
+    """
+    Zeichen -> Glyphen. Der Text wird zuerst nach NFC normalisiert (z.B. "a" +
+    U+0328 -> "ą"). Fehlt ein Zeichen in der Schriftart, wird seine Zerlegung
+    (NFD) versucht: "ą" wird dann aus "a" und dem Ogonek zusammengesetzt, bzw.
+    nur als "a" gezeichnet, wenn auch das Ogonek fehlt; das Zeichen zählt dann
+    trotzdem als fehlend. Liefert (Glyphennamen, fehlende Zeichen).
+    """
+    cmap = font.cmap
+    glyphs = []
+    missing = []
+    for char in unicodedata.normalize("NFC", text):
+        glyph_name = cmap.get(ord(char))
+        if glyph_name is not None:
+            glyphs.append(glyph_name)
+            continue
+        parts = [cmap.get(ord(part)) for part in unicodedata.normalize("NFD", char)]
+        if len(parts) > 1 and parts[0] is not None:
+            glyphs.extend(part for part in parts if part is not None)
+            if None not in parts:
+                continue
+        missing.append(char)
+    return glyphs, missing
+
+def apply_ligatures(glyphs: list, ligatures: dict) -> list:
+    if not ligatures:
+        return glyphs
+    result = []
+    i = 0
+    while i < len(glyphs):
+        for components, ligature in ligatures.get(glyphs[i], ()):
+            if tuple(glyphs[i + 1:i + 1 + len(components)]) == components:
+                result.append(ligature)
+                i += 1 + len(components)
+                break
+        else:
+            result.append(glyphs[i])
+            i += 1
+    return result
+
+def layout_text(font_name: str, text: str, shaping: bool = True) -> tuple:
+    """
+    Positioniert die Glyphen eines Texts. Liefert ([(Glyphe, x, y)], Breite,
+    fehlende Zeichen). Mit `shaping` werden Ligaturen (GSUB 'liga'), Paar-Kerning
+    (GPOS 'kern' bzw. 'kern'-Tabelle) und Markenanker (GPOS 'mark') angewendet,
+    sonst nur die Vorschubbreiten aus hmtx. Kerning wirkt zwischen Basisglyphen,
+    Marks dazwischen werden übersprungen; per Anker angehängte Marks rücken den
+    Stift nicht weiter.
+    """
+    font = load_font(font_name)
+    hmtx = font.hmtx
+    glyphs, missing = map_glyphs(font, text)
+    if shaping:
+        glyphs = apply_ligatures(glyphs, font.ligatures)
+        kerning = font.kerning
+        kern_pairs = kerning.pairs
+
+    placements = []
     current_x = 0
+    base = None      # letzte Basisglyphe
+    base_x = 0
+    for glyph_name in glyphs:
+        if shaping and glyph_name in font.mark_glyphs and base is not None:
+            for key, mark_class, mark_x, mark_y in font.mark_anchors.get(glyph_name, ()):
+                anchor = base_anchor(font, base, key, mark_class)
+                if anchor is not None:
+                    # Angehängte Marks sitzen auf der Basis und haben keinen eigenen Vorschub
+                    placements.append((glyph_name, base_x + anchor[0] - mark_x, anchor[1] - mark_y))
+                    break
+            else:
+                # Ohne Anker: an der aktuellen Position, Combining Marks ragen nach links über die Basis
+                placements.append((glyph_name, current_x, 0))
+                current_x += hmtx[glyph_name][0]
+            continue
+        if shaping and base is not None:
+            value = kern_pairs.get((base, glyph_name))
+            current_x += kerning.pair(base, glyph_name) if value is None else value
+        placements.append((glyph_name, current_x, 0))
+        base, base_x = glyph_name, current_x
+        current_x += hmtx[glyph_name][0]
+    return placements, current_x, missing
+
+def render_svg(font_name: str, text: str, compact: bool = False, precision: int = 1, shaping: bool = True) -> tuple:
+    """
+    Erzeugt den SVG-Inhalt für einen Text. Liefert (SVG, fehlende Zeichen).
+    compact: jede Glyphe einmal in <defs>, Platzierung per <use>, Pfade kompakt kodiert.
+    shaping: Kerning, Ligaturen und Markenanker anwenden (siehe layout_text).
+    """
+    font = load_font(font_name)
+    ascent = font.ascent
+    descent = font.descent
+
+    placements, total_width, missing = layout_text(font_name, text, shaping)
     paths = []
+    defs = {}  # Glyphenname -> id, nur im compact-Modus
+
+    for glyph_name, x, y in placements:
+        if compact:
+            path_data, _ = glyph_outline(font_name, glyph_name, precision)
+            if path_data:
+                if glyph_name not in defs:
+                    defs[glyph_name] = f"g{len(defs)}"
+                offset = f' y="{format_number(y, precision)}"' if y else ""
+                paths.append(f'<use xlink:href="#{defs[glyph_name]}" x="{format_number(x, precision)}"{offset}/>')
+        else:
+            path_data, _ = glyph_outline(font_name, glyph_name)
+            paths.append(f'<path d="{path_data}" transform="translate({x}, {y})" />')
+
+    if compact:
+        glyphs = "".join(f'<path id="{glyph_id}" d="{glyph_outline(font_name, glyph_name, precision)[0]}"/>'
+                         for glyph_name, glyph_id in defs.items())
+        svg_content = f'''<?xml version="1.0" standalone="no"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="{total_width}" height="{ascent - descent}" viewBox="0 {descent} {total_width} {ascent - descent}">
+<defs>{glyphs}</defs>
+<g transform="translate(0 {ascent}) scale(1 -1)">{''.join(paths)}</g>
+</svg>
+'''
+        return svg_content, missing
 
-    for char in text:
-        codepoint = ord(char)
-        if codepoint not in cmap:
-            print(f"Warnung: Zeichen '{char}' nicht in der Schriftart gefunden.")
-            continue
-        glyph_name = cmap[codepoint]
-        glyph = glyph_set[glyph_name]
-        pen = SVGPathPen(glyph_set)
-        glyph.draw(pen)
-        path_data = pen.getCommands()
-        advance_width = hmtx[glyph_name][0]
-        paths.append(f'<path d="{path_data}" transform="translate({current_x}, 0)" />')
-        current_x += advance_width
-
-    total_width = current_x
     svg_content = f'''<?xml version="1.0" standalone="no"?>
 <svg xmlns="http://www.w3.org/2000/svg" width="{total_width}" height="{ascent - descent}" viewBox="0 {descent} {total_width} {ascent - descent}">
   <g transform="translate(0, {ascent}) scale(1, -1)">
@@ -78,10 +469,20 @@ def text_to_svg(font_name: str, text: str, output_svg: str) -> None:
   </g>
 </svg>
 '''
+    return svg_content, missing
+
+def text_to_svg(font_name: str, text: str, output_svg: str, compact: bool = False, precision: int = 1,
+                shaping: bool = True) -> None:
+    svg_content, missing = render_svg(font_name, text, compact, precision, shaping)
+    for char in missing:
+        print(f"Warnung: Zeichen '{char}' nicht in der Schriftart gefunden.")
     with open(output_svg, "w", encoding="utf-8") as f:
         f.write(svg_content)
     print(f"SVG wurde erfolgreich erstellt: {output_svg}")
 
+def svg_file_name(text: str) -> str:
+    return f"{text[:24].replace(' ', '_')}.svg"
+
 
 def create_rectangle_svg(output_svg: str, width: float, height: float, corner_radius: float = 0) -> None:
     # Erstellen des Dateinamens unter Berücksichtigung der Abmessungen des Rechtecks
@@ -103,34 +504,197 @@ def load_csv_and_generate_svgs(csv_file: str, font_name: str) -> None:
     """
     Lädt eine CSV-Datei, die eine Liste von Texten enthält, und erzeugt für jeden Text ein SVG.
     Die SVGs werden in einem Ordner gespeichert, der nach dem CSV-Dateinamen benannt ist.
+    Unveränderte SVGs werden nicht neu geschrieben (siehe batch_generate_svgs).
+    """
+    batch_generate_svgs([csv_file], [font_name], jobs=1)
+
+def read_csv_texts(csv_file: str) -> list:
+    """Alle nicht-leeren Zellen einer CSV-Datei, in Dateireihenfolge."""
+    with open(csv_file, mode="r", encoding="utf-8") as f:
+        return [text.strip() for row in csv.reader(f, delimiter=',') for text in row if text.strip()]
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def font_file_hash(font_name: str) -> str:
+    with open(get_font_path(font_name), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def output_key(font_name: str, text: str, compact: bool, precision: int, shaping: bool) -> str:
+    """
+    Inhaltsadresse eines SVGs: Hash über Schriftart-Datei, Text und Render-Optionen.
+    Gleicher Schlüssel -> gleiches SVG, es muss nicht neu erzeugt werden.
     """
+    options = {"compact": compact, "precision": precision if compact else None, "shaping": shaping}
+    data = json.dumps([RENDER_VERSION, font_file_hash(font_name), text, options], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def load_manifest(svg_folder: str) -> dict:
+    """Dateiname -> Schlüssel der zuletzt erzeugten SVGs; leer, wenn es (noch) kein Manifest gibt."""
     try:
-        # Extrahiere den Namen der CSV-Datei ohne Erweiterung für den Ordnernamen
-        csv_name = os.path.splitext(os.path.basename(csv_file))[0]
-        
-        # Erstelle den Zielordner (wenn er nicht existiert)
-        svg_folder = get_output_path(f"svg_from_csv_{csv_name}")
-        os.makedirs(svg_folder, exist_ok=True)
-        
-        with open(csv_file, mode="r", encoding="utf-8") as f:
-            reader = csv.reader(f, delimiter=',')
-            for row in reader:
-                print(f"Verarbeite Zeile: {row}")  # Ausgabe der gesamten Zeile
-                if row:
-                    for text in row:
-                        text = text.strip()
-                        if text:
-                            print(f"Erstelle SVG für: {text}")
-                            # Pfad für jedes SVG im entsprechenden Ordner
-                            output_svg_path = os.path.join(svg_folder, f"{text[:24].replace(' ', '_')}.svg")
-                            # Die Funktion text_to_svg wird nun den Pfad erhalten, um das SVG dort zu speichern
-                            text_to_svg(font_name, text, output_svg_path)
-                        else:
-                            print("Leere Zelle übersprungen.")
-    except FileNotFoundError:
-        print(f"Fehler: Die Datei {csv_file} wurde nicht gefunden.")
+        with open(os.path.join(svg_folder, MANIFEST_NAME), encoding="utf-8") as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(svg_folder: str, manifest: dict) -> None:
+    # Erst in eine Temp-Datei, dann ersetzen: ein abgebrochener Lauf hinterlässt kein halbes Manifest
+    path = os.path.join(svg_folder, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def render_job(job: tuple) -> tuple:
+    """
+    Worker für den Batch-Modus: rendert einen Text und schreibt das SVG.
+    Jeder Worker-Prozess hat seinen eigenen, warmen Font- und Glyphen-Cache.
+    Liefert (fehlende Zeichen, Fehlermeldung oder None).
+    """
+    font_name, text, output_svg, compact, precision, shaping = job
+    try:
+        svg_content, missing = render_svg(font_name, text, compact, precision, shaping)
+        with open(output_svg, "w", encoding="utf-8") as f:
+            f.write(svg_content)
+        return missing, None
     except Exception as e:
-        print(f"Fehler beim Verarbeiten der CSV-Datei: {e}")
+        return [], str(e)
+
+def warm_fonts(font_names: list) -> None:
+    for font_name in font_names:
+        load_font(font_name)
+
+def batch_generate_svgs(csv_files: list, font_names: list, jobs: int = None,
+                        compact: bool = False, precision: int = 1, shaping: bool = True,
+                        force: bool = False) -> bool:
+    """
+    Erzeugt die SVGs aller Texte aus mehreren CSV-Dateien mit mehreren Schriftarten
+    über einen Prozess-Pool. Ausgabe wie load_csv_and_generate_svgs nach
+    svg/svg_from_csv_<CSV>/, bei mehreren Schriftarten svg/svg_from_csv_<CSV>-<Schriftart>/.
+
+    Jeder Ausgabeordner hat ein Manifest (Dateiname -> output_key). SVGs, deren
+    Schlüssel sich nicht geändert hat, werden nicht neu geschrieben (force: doch),
+    SVGs aus dem Manifest, deren Text nicht mehr in der CSV steht, werden gelöscht.
+    Gibt am Ende eine Zusammenfassung mit den Änderungen aus; liefert False, wenn
+    etwas fehlgeschlagen ist.
+    """
+    start = time.perf_counter()
+    work = []       # (font_name, text, output_svg, compact, precision, shaping)
+    groups = []     # (CSV, Schriftart, Ordner, altes Manifest, {Dateiname: Schlüssel})
+    duplicates = 0
+    unchanged = 0
+    ok = True
+    # Schriftart-Dateien einmal hashen (output_key); fehlende gleich hier melden
+    fonts = []
+    for font_name in font_names:
+        try:
+            font_file_hash(font_name)
+            fonts.append(font_name)
+        except OSError as e:
+            print(f"Fehler: Schriftart {font_name}: {e}")
+            ok = False
+    for csv_file in csv_files:
+        try:
+            texts = read_csv_texts(csv_file)
+        except OSError as e:
+            print(f"Fehler: {csv_file}: {e}")
+            ok = False
+            continue
+        csv_name = os.path.splitext(os.path.basename(csv_file))[0]
+        # Gleicher Dateiname (doppelter Eintrag oder gleiche ersten 24 Zeichen):
+        # der letzte Eintrag gewinnt, wie früher beim Überschreiben der Datei
+        by_file = {}
+        for text in texts:
+            file_name = svg_file_name(text)
+            if file_name in by_file:
+                duplicates += 1
+                print(f"Hinweis: {csv_name}: '{by_file[file_name]}' übersprungen, "
+                      f"'{text}' ergibt ebenfalls {file_name}")
+            by_file[file_name] = text
+        for font_name in fonts:
+            folder = f"svg_from_csv_{csv_name}"
+            if len(font_names) > 1:
+                folder += f"-{os.path.splitext(font_name)[0]}"
+            svg_folder = get_output_path(folder)
+            os.makedirs(svg_folder, exist_ok=True)
+            manifest = load_manifest(svg_folder)
+            keys = {}
+            for file_name, text in by_file.items():
+                keys[file_name] = output_key(font_name, text, compact, precision, shaping)
+                output_svg = os.path.join(svg_folder, file_name)
+                if not force and manifest.get(file_name) == keys[file_name] and os.path.exists(output_svg):
+                    unchanged += 1
+                    continue
+                work.append((font_name, text, output_svg, compact, precision, shaping))
+            groups.append((csv_name, font_name, svg_folder, manifest, keys))
+
+    # Nur Schriftarten laden, für die es etwas zu rendern gibt
+    needed = sorted({job[0] for job in work})
+    workers = max(1, min(jobs or os.cpu_count() or 1, len(work)))
+    if not work:
+        results = []
+    elif workers == 1:
+        warm_fonts(needed)
+        results = list(map(render_job, work))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=warm_fonts, initargs=(needed,)) as pool:
+            results = list(pool.map(render_job, work, chunksize=max(1, len(work) // (workers * 4))))
+
+    # Zusammenfassung: Ergebnisse kommen in Job-Reihenfolge zurück
+    missing = {}
+    errors = []
+    failed = set()
+    rendered = set()
+    for (font_name, text, output_svg, *_), (missing_chars, error) in zip(work, results):
+        if error:
+            errors.append(f"{output_svg}: {error}")
+            failed.add(output_svg)
+        else:
+            rendered.add(output_svg)
+        for char in missing_chars:
+            missing.setdefault(font_name, set()).add(char)
+
+    removed = 0
+    for csv_name, font_name, svg_folder, manifest, keys in groups:
+        changes = []
+        for file_name, key in keys.items():
+            if os.path.join(svg_folder, file_name) in rendered:
+                # "erneuert": gleicher Schlüssel, aber Datei fehlte oder --force
+                kind = "neu" if file_name not in manifest else "geändert" if manifest[file_name] != key else "erneuert"
+                changes.append((kind, file_name))
+        # Verwaiste SVGs: im Manifest, aber zu keinem Text der CSV mehr gehörig
+        for file_name in sorted(set(manifest) - set(keys)):
+            try:
+                os.remove(os.path.join(svg_folder, file_name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                errors.append(f"{os.path.join(svg_folder, file_name)}: {e}")
+                continue
+            changes.append(("entfernt", file_name))
+            removed += 1
+        # Fehlgeschlagene SVGs nicht eintragen, damit sie beim nächsten Lauf erneut versucht werden
+        new_manifest = {file_name: key for file_name, key in keys.items()
+                        if os.path.join(svg_folder, file_name) not in failed}
+        if new_manifest != manifest:
+            save_manifest(svg_folder, new_manifest)
+
+        counts = Counter(kind for kind, _ in changes)
+        print(f"{csv_name} / {font_name}: {len(keys)} SVGs"
+              + "".join(f", {counts[kind]} {kind}" for kind in ("neu", "geändert", "erneuert", "entfernt") if counts[kind]))
+        # Beim ersten Lauf (noch kein Manifest) wäre jede Datei "neu", das listet niemand gern auf
+        if manifest:
+            for kind, file_name in changes:
+                print(f"  {kind}: {file_name}")
+    for font_name, chars in missing.items():
+        print(f"Warnung: {font_name} enthält diese Zeichen nicht: {' '.join(sorted(chars))}")
+    for error in errors:
+        print(f"Fehler: {error}")
+    print(f"{len(rendered)} SVGs erstellt, {unchanged} unverändert"
+          + (f", {removed} entfernt" if removed else "")
+          + (f", {len(failed)} fehlgeschlagen" if failed else "")
+          + (f", {duplicates} doppelte Einträge übersprungen" if duplicates else "")
+          + (f", {workers} Prozess(e)" if work else "")
+          + f", {time.perf_counter() - start:.2f} s")
+    return ok and not errors
 
 
 def interactive_mode() -> None:
@@ -160,7 +724,7 @@ def interactive_mode() -> None:
                 text_or_csv = input("Möchtest du Text eingeben (1) oder eine CSV-Datei laden (2)? ").strip()
                 if text_or_csv == "1":
                     text = input("Gib den Text ein, der in SVG umgewandelt werden soll: ").strip()
-                    text_to_svg(font_name, text)
+                    text_to_svg(font_name, text, get_output_path(svg_file_name(text)))
                 elif text_or_csv == "2":
                     csv_file = input("Gib den Pfad zur CSV-Datei ein: ").strip()
                     load_csv_and_generate_svgs(csv_file, font_name)
@@ -182,5 +746,41 @@ def interactive_mode() -> None:
         else:
             print("Ungültige Eingabe.")
 
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Text in SVG-Pfade umwandeln (ohne Argumente: interaktiver Modus)")
+    parser.add_argument("--font", nargs="+", help="Schriftart(en) aus dem 'fonts'-Ordner")
+    parser.add_argument("--text", help="Text in ein SVG umwandeln")
+    parser.add_argument("--batch", action="store_true", help="CSV-Dateien (--csv) mit allen Schriftarten (--font) parallel verarbeiten")
+    parser.add_argument("--csv", nargs="+", help="CSV-Datei(en) für --batch")
+    parser.add_argument("--jobs", type=int, help="Anzahl Worker-Prozesse für --batch (Standard: Anzahl CPU-Kerne)")
+    parser.add_argument("--compact", action="store_true", help="Glyphen per <defs>/<use> wiederverwenden, Pfade kompakt kodieren")
+    parser.add_argument("--precision", type=int, default=1, help="Nachkommastellen der Koordinaten bei --compact (Standard: 1)")
+    parser.add_argument("--force", action="store_true", help="bei --batch alle SVGs neu erzeugen, auch unveränderte")
+    parser.add_argument("--no-shaping", dest="shaping", action="store_false",
+                        help="ohne Kerning, Ligaturen und Markenanker, nur die Vorschubbreiten der Glyphen")
+    parser.add_argument("--rect", action="store_true", help="Rechteck-SVG erzeugen")
+    parser.add_argument("--width", type=float, help="Breite des Rechtecks (mm)")
+    parser.add_argument("--height", type=float, help="Höhe des Rechtecks (mm)")
+    parser.add_argument("--radius", type=float, default=0, help="Eckenradius (mm)")
+    args = parser.parse_args()
+
+    if args.batch:
+        if not args.csv or not args.font:
+            parser.error("--batch braucht --csv und --font")
+        ok = batch_generate_svgs(args.csv, args.font, args.jobs, args.compact, args.precision, args.shaping,
+                                 args.force)
+        sys.exit(0 if ok else 1)
+    elif args.text:
+        if not args.font or len(args.font) != 1:
+            parser.error("--text braucht genau eine --font")
+        text_to_svg(args.font[0], args.text, get_output_path(svg_file_name(args.text)), args.compact, args.precision,
+                    args.shaping)
+    elif args.rect:
+        if args.width is None or args.height is None:
+            parser.error("--rect braucht --width und --height")
+        create_rectangle_svg("rectangle.svg", args.width, args.height, args.radius)
+    else:
+        interactive_mode()
+
 if __name__ == "__main__":
-    interactive_mode()
+    main()